@@ -0,0 +1,67 @@
+from os import path
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+benchmarks_dir = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(path.dirname(benchmarks_dir), 'scripts'))
+
+import cli
+import go_closure
+
+
+# functions of stringdb that namespace-ann-counts queries through, each of
+# which has to show up as the query of its metrics records
+EXPECTED_QUERIES = ('get_species_prots', 'get_species_explicit_annotations')
+
+
+def get_query_records(species_id):
+    with tempfile.TemporaryDirectory() as out_dir:
+        metrics_path = path.join(out_dir, 'metrics.jsonl')
+
+        subprocess.run([sys.executable, path.join(path.dirname(benchmarks_dir), 'scripts', 'go_tools.py'),
+                        'namespace-ann-counts', 'stringdb', str(species_id), path.join(out_dir, 'counts.tsv')],
+                       env=dict(os.environ, STRINGDB_METRICS=metrics_path), check=True)
+
+        with open(metrics_path) as metrics_f:
+            return [record for record in map(json.loads, metrics_f) if record['event'] == 'query']
+
+def check_query_records(queries):
+    errors = []
+
+    for name in EXPECTED_QUERIES:
+        records = [query for query in queries if query['query'] == name]
+
+        if not records:
+            errors.append(f'no query records of {name}, found: {sorted({query["query"] for query in queries})}')
+        elif not any(query['rows'] > 0 for query in records):
+            errors.append(f'no rows counted for {name}')
+
+    return errors
+
+
+# checks the query metrics against the benchmark fixture, see run_benchmarks.py
+if __name__ == '__main__':
+    args, options = cli.parse_options(sys.argv)
+
+    dbname = options.get('dbname', 'stringdb_bench')
+    work_dir = options.get('work-dir', path.join(go_closure.get_cache_dir(), 'benchmarks'))
+
+    with open(path.join(work_dir, 'fixture.json')) as info_f:
+        info = json.load(info_f)
+
+    os.environ['STRINGDB_DBNAME'] = dbname
+    os.environ['GO_OBO_PATH'] = path.join(work_dir, 'go.obo')
+    os.environ['GO_CURATED_FREQUENCIES_PATH'] = path.join(work_dir, 'go_curated_frequencies.tab')
+
+    errors = check_query_records(get_query_records(info['host_species_id']))
+
+    for error in errors:
+        print(error, file=sys.stderr)
+
+    if errors:
+        sys.exit(1)
+
+    print('query metrics ok', file=sys.stderr)
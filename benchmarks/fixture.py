@@ -0,0 +1,323 @@
+from os import path
+import io
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.realpath(__file__))), 'scripts'))
+
+import stringdb
+
+
+GO_ROOTS = (
+    ('GO:0008150', 'biological_process'),
+    ('GO:0005575', 'cellular_component'),
+    ('GO:0003674', 'molecular_function'))
+
+EVIDENCE_CODES = ('EXP', 'IDA', 'IPI', 'IMP', 'IGI', 'IEP', 'TAS', 'IC', 'ISS', 'IEA')
+
+HOST_SPECIES_ID = 9606
+
+
+# scale 1 is a few hundred thousand links; every size grows linearly with it
+class FixtureScale:
+    def __init__(self, scale=1.0, n_host_species=3, n_virus_species=5, seed=0):
+        self.scale = scale
+        self.n_host_species = n_host_species
+        self.n_virus_species = n_virus_species
+        self.seed = seed
+
+        self.n_go_terms = max(100, int(3000 * scale))
+        self.prots_per_species = max(50, int(2000 * scale))
+        self.prots_per_virus = max(10, int(50 * scale))
+        self.links_per_prot = 20
+        self.anns_per_prot = 8
+        self.virus_host_links = 40
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def write_go_obo(obo_path, n_terms, seed=0, obsolete_fraction=0.01, alt_id_fraction=0.05):
+    rng = np.random.RandomState(seed)
+    namespaces = rng.randint(0, len(GO_ROOTS), n_terms)
+
+    with open(obo_path, 'w') as obo_f:
+        print('format-version: 1.2\nontology: go\n', file=obo_f)
+
+        for go, namespace in GO_ROOTS:
+            print(f'[Term]\nid: {go}\nname: {namespace}\nnamespace: {namespace}\n', file=obo_f)
+
+        ns_terms = [[root] for root, _ in GO_ROOTS]
+
+        for i in range(n_terms):
+            go = f'GO:{1000000 + i:07d}'
+            ns = namespaces[i]
+            root, namespace = GO_ROOTS[ns]
+
+            print(f'[Term]\nid: {go}\nname: synthetic term {i}\nnamespace: {namespace}', file=obo_f)
+
+            if rng.rand() < alt_id_fraction:
+                print(f'alt_id: GO:{2000000 + i:07d}', file=obo_f)
+
+            if rng.rand() < obsolete_fraction:
+                print(f'is_obsolete: true\nreplaced_by: {ns_terms[ns][-1]}\n', file=obo_f)
+                continue
+
+            # parents among the earlier terms of the namespace, biased towards
+            # recent ones so that the DAG gets deep
+            candidates = ns_terms[ns]
+            n_parents = min(len(candidates), 1 + rng.poisson(0.5))
+            parents = {candidates[len(candidates) - 1 - min(int(rng.exponential(20)), len(candidates) - 1)] for _ in range(n_parents)}
+
+            for parent in sorted(parents):
+                print(f'is_a: {parent}', file=obo_f)
+
+            print('', file=obo_f)
+            ns_terms[ns].append(go)
+
+    return [go for terms in ns_terms for go in terms[1:]]
+
+
+def copy_frame(cursor, table, frame):
+    buf = io.StringIO()
+    frame.to_csv(buf, sep='\t', header=False, index=False)
+    buf.seek(0)
+
+    cursor.copy_from(buf, table, columns=tuple(frame.columns))
+
+
+# drop/create database cannot run in a transaction block, and psycopg2 opens
+# one inside `with conn` even in autocommit mode, so this uses a plain
+# connection instead of a session
+def create_database(dbname):
+    conn = stringdb.connect_to_docker(dbname='stringdb')
+
+    try:
+        conn.autocommit = True
+
+        with conn.cursor() as cursor:
+            cursor.execute(f'drop database if exists {dbname};')
+            cursor.execute(f'create database {dbname};')
+    finally:
+        conn.close()
+
+def create_schema(cursor):
+    cursor.execute("""
+        create schema items;
+        create schema network;
+        create schema mapping;
+
+        create table items.species (
+            species_id    integer not null,
+            official_name text    not null,
+            kingdom       text    not null
+        );
+
+        create table items.proteins (
+            protein_id          integer not null,
+            protein_external_id text    not null,
+            species_id          integer not null,
+            preferred_name      text    not null
+        );
+
+        create table network.node_node_links (
+            node_id_a       integer   not null,
+            node_type_a     integer   not null,
+            node_id_b       integer   not null,
+            node_type_b     integer   not null,
+            combined_score  smallint  not null,
+            evidence_scores integer[] not null
+        );
+
+        create table mapping.gene_ontology (
+            species_id       integer  not null,
+            string_id        integer,
+            string_name      text     not null,
+            common_name      text     not null,
+            go_old_id        text     not null,
+            go_old_name      text     not null,
+            go_id            text     not null,
+            evidence_source  text     not null,
+            evidence_code    text     not null,
+            confidence_score smallint not null
+        );
+
+        create table mapping.uniprot (
+            species_id  integer not null,
+            string_id   integer,
+            string_name text    not null,
+            uniprot_ac  text    not null,
+            uniprot_id  text    not null,
+            identity    real    not null,
+            bit_score   real    not null
+        );
+        """)
+
+def create_indices(cursor):
+    cursor.execute("""
+        create unique index pi_proteins on items.proteins (protein_id);
+        create index si_proteins_species_id on items.proteins (species_id);
+        create index si_proteins_external_id on items.proteins (protein_external_id);
+
+        create index si_node_node_links_node_type_b on network.node_node_links using brin (node_type_b) with (pages_per_range = 128);
+
+        create index si_gene_ontology_string_id on mapping.gene_ontology using brin (string_id) with (pages_per_range = 4);
+        create index si_gene_ontology_species_id on mapping.gene_ontology using brin (species_id) with (pages_per_range = 128);
+
+        create index si_uniprot_string_id on mapping.uniprot using brin (string_id) with (pages_per_range = 4);
+        create index si_uniprot_species_id on mapping.uniprot using brin (species_id) with (pages_per_range = 128);
+        create index si_uniprot_uniprot_ac on mapping.uniprot using btree (uniprot_ac) with (fillfactor = 100);
+
+        analyze;
+        """)
+
+
+def make_species(scale):
+    host_ids = [HOST_SPECIES_ID] + [10090 + k for k in range(scale.n_host_species - 1)]
+    virus_ids = [10000000 + k for k in range(scale.n_virus_species)]
+
+    species = pd.DataFrame({
+        'species_id': host_ids + virus_ids,
+        'official_name': [f'Synthetic host {k}' for k in range(len(host_ids))] + [f'Synthetic virus {k}' for k in range(len(virus_ids))],
+        'kingdom': ['eukaryota'] * len(host_ids) + ['viruses'] * len(virus_ids)})
+
+    return species, host_ids, virus_ids
+
+def make_proteins(scale, host_ids, virus_ids):
+    sizes = [scale.prots_per_species] * len(host_ids) + [scale.prots_per_virus] * len(virus_ids)
+    species_ids = np.repeat(host_ids + virus_ids, sizes)
+
+    protein_ids = np.arange(1, len(species_ids) + 1)
+    names = [f'SYN{i:08d}' for i in protein_ids]
+
+    return pd.DataFrame({
+        'protein_id': protein_ids,
+        'protein_external_id': [f'{species_id}.{name}' for species_id, name in zip(species_ids, names)],
+        'species_id': species_ids,
+        'preferred_name': names})
+
+def format_evidence_scores(rng, n_links):
+    n_scores = rng.randint(1, 4, n_links)
+    score_types = rng.randint(1, 14, n_scores.sum())
+    scores = rng.randint(150, 1000, n_scores.sum())
+
+    pairs = [f'{{{score_type},{score}}}' for score_type, score in zip(score_types, scores)]
+    offsets = np.concatenate([[0], np.cumsum(n_scores)])
+
+    return ['{' + ','.join(pairs[offsets[k]:offsets[k+1]]) + '}' for k in range(n_links)]
+
+def make_links(scale, proteins, host_ids, virus_ids, rng):
+    frames = []
+
+    for species_id in host_ids + virus_ids:
+        prots = proteins.protein_id[proteins.species_id == species_id].to_numpy()
+        n_links = len(prots) * scale.links_per_prot // 2
+
+        frames.append(pd.DataFrame({'node_id_a': rng.choice(prots, n_links), 'node_type_a': species_id,
+                                    'node_id_b': rng.choice(prots, n_links), 'node_type_b': species_id}))
+
+    host_prots = proteins.protein_id[proteins.species_id == HOST_SPECIES_ID].to_numpy()
+
+    for virus_id in virus_ids:
+        virus_prots = proteins.protein_id[proteins.species_id == virus_id].to_numpy()
+        n_links = len(virus_prots) * scale.virus_host_links
+
+        frames.append(pd.DataFrame({'node_id_a': rng.choice(virus_prots, n_links), 'node_type_a': virus_id,
+                                    'node_id_b': rng.choice(host_prots, n_links), 'node_type_b': HOST_SPECIES_ID}))
+
+    links = pd.concat(frames, ignore_index=True)
+    links = links[links.node_id_a != links.node_id_b].drop_duplicates(['node_id_a', 'node_id_b'])
+
+    # STRING stores both directions of every link
+    reverse = links.rename(columns={'node_id_a': 'node_id_b', 'node_type_a': 'node_type_b',
+                                    'node_id_b': 'node_id_a', 'node_type_b': 'node_type_a'})
+    links = pd.concat([links, reverse[links.columns]], ignore_index=True)
+
+    links['combined_score'] = rng.randint(150, 1000, len(links))
+    links['evidence_scores'] = format_evidence_scores(rng, len(links))
+
+    return links.sort_values(['node_type_b', 'node_id_a']).reset_index(drop=True)
+
+def make_gene_ontology(scale, proteins, go_terms, rng):
+    annotated = proteins[proteins.species_id < 10000000]
+    n_anns = rng.poisson(scale.anns_per_prot, len(annotated))
+
+    rows = annotated.loc[annotated.index.repeat(n_anns)]
+    go_ids = np.array(go_terms)[rng.randint(0, len(go_terms), len(rows))]
+
+    gene_ontology = pd.DataFrame({
+        'species_id': rows.species_id.to_numpy(),
+        'string_id': rows.protein_id.to_numpy(),
+        'string_name': rows.preferred_name.to_numpy(),
+        'common_name': rows.preferred_name.to_numpy(),
+        'go_old_id': go_ids,
+        'go_old_name': 'synthetic term',
+        'go_id': go_ids,
+        'evidence_source': 'synthetic',
+        'evidence_code': rng.choice(EVIDENCE_CODES, len(rows)),
+        'confidence_score': rng.randint(1, 6, len(rows))})
+
+    return gene_ontology.sort_values(['species_id', 'string_id', 'go_id']).reset_index(drop=True)
+
+def make_uniprot(proteins, rng):
+    n_acs = rng.choice([0, 1, 1, 1, 2], len(proteins))
+    rows = proteins.loc[proteins.index.repeat(n_acs)]
+
+    uniprot_acs = [f'S{k:09d}' for k in range(len(rows))]
+
+    uniprot = pd.DataFrame({
+        'species_id': rows.species_id.to_numpy(),
+        'string_id': rows.protein_id.to_numpy(),
+        'string_name': rows.preferred_name.to_numpy(),
+        'uniprot_ac': uniprot_acs,
+        'uniprot_id': [f'{ac}_SYN' for ac in uniprot_acs],
+        'identity': rng.uniform(30, 100, len(rows)).round(1),
+        'bit_score': rng.uniform(50, 2000, len(rows)).round(1)})
+
+    return uniprot.sort_values(['species_id', 'string_id', 'uniprot_ac']).reset_index(drop=True)
+
+
+# creates dbname on the stringdb service and fills it with synthetic data of
+# the given scale, shaped like the tables the import scripts create. The
+# evidence_scores table is built by import_stringdb_evidence_scores.sh itself.
+def create_fixture(dbname, obo_path, scale):
+    import subprocess
+
+    rng = np.random.RandomState(scale.seed)
+    go_terms = write_go_obo(obo_path, scale.n_go_terms, scale.seed)
+
+    species, host_ids, virus_ids = make_species(scale)
+    proteins = make_proteins(scale, host_ids, virus_ids)
+
+    tables = [
+        ('items.species', species),
+        ('items.proteins', proteins),
+        ('network.node_node_links', make_links(scale, proteins, host_ids, virus_ids, rng)),
+        ('mapping.gene_ontology', make_gene_ontology(scale, proteins, go_terms, rng)),
+        ('mapping.uniprot', make_uniprot(proteins, rng))]
+
+    create_database(dbname)
+
+    with stringdb.get_docker_session(dbname=dbname).cursor() as cursor:
+        create_schema(cursor)
+
+        for table, frame in tables:
+            print(f'loading {len(frame)} rows into {table}', file=sys.stderr)
+            copy_frame(cursor, table, frame)
+
+        create_indices(cursor)
+
+    script_dir = path.join(path.dirname(path.dirname(path.realpath(__file__))), 'scripts')
+    subprocess.run([path.join(script_dir, 'import_stringdb_evidence_scores.sh'), 'stringdb', 'stringdb', dbname],
+                   cwd=path.dirname(script_dir), check=True)
+
+    return {
+        'host_species_id': HOST_SPECIES_ID,
+        'host_species_ids': host_ids,
+        'virus_species_ids': virus_ids,
+        'go_terms': go_terms,
+        'uniprot_acs': tables[-1][1].uniprot_ac.tolist(),
+        'scale': scale.as_dict(),
+        'rows': {table: len(frame) for table, frame in tables}}
@@ -0,0 +1,71 @@
+from os import path
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.realpath(__file__))), 'scripts'))
+
+import stringdb_virus
+
+
+def make_host_network(n_edges, n_prots, host_species_id=9606, seed=0):
+    rng = np.random.RandomState(seed)
+
+    string_ids = np.arange(1, n_prots + 1) * 7
+    network = pd.DataFrame({
+        'node_type_a': host_species_id,
+        'node_type_b': host_species_id,
+        'node_id_a': rng.choice(string_ids, n_edges),
+        'node_id_b': rng.choice(string_ids, n_edges),
+        'score_type': rng.randint(1, 14, n_edges),
+        'evidence_score': rng.randint(150, 1000, n_edges)
+    })
+
+    external_ids = pd.DataFrame({
+        'string_id': string_ids,
+        'external_id': [f'{host_species_id}.ENSP{i:011d}' for i in string_ids]
+    })
+
+    return network, external_ids
+
+
+# reference implementation with two merges, which also keeps duplicate edges
+def map_network_ids_merge(network, external_ids):
+    network = network.merge(external_ids.rename(columns={'string_id': 'node_id_a', 'external_id': 'external_id_a'}), on='node_id_a')
+    network = network.merge(external_ids.rename(columns={'string_id': 'node_id_b', 'external_id': 'external_id_b'}), on='node_id_b')
+
+    return network.drop(columns=['node_id_a', 'node_id_b']).rename(columns={'external_id_a': 'node_id_a', 'external_id_b': 'node_id_b'})
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    fn(*args)
+
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'seconds': elapsed, 'peak_bytes': peak}
+
+
+if __name__ == '__main__':
+    n_edges = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    n_prots = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    network, external_ids = make_host_network(n_edges, n_prots)
+
+    results = {
+        'n_edges': n_edges,
+        'n_prots': n_prots,
+        'network_bytes': int(network.memory_usage(deep=True).sum()),
+        'map_network_ids': measure(stringdb_virus.map_network_ids, network, external_ids),
+        'merge': measure(map_network_ids_merge, network, external_ids)
+    }
+
+    print(json.dumps(results, indent=2))
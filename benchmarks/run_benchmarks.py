@@ -0,0 +1,178 @@
+from os import path
+import datetime
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+benchmarks_dir = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(path.dirname(benchmarks_dir), 'scripts'))
+
+import fixture
+import go_closure
+import go_tools
+import import_swissprot
+import stringdb
+import stringdb_virus
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=benchmarks_dir,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def bench(results, name, fn, *args, **kwargs):
+    print(f'[{name}]', file=sys.stderr)
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    value = fn(*args, **kwargs)
+
+    results[name] = {
+        'seconds': time.perf_counter() - start,
+        'cpu_seconds': time.process_time() - cpu_start}
+
+    if isinstance(value, list):
+        results[name]['items'] = len(value)
+
+    print(f'[{name}] {results[name]["seconds"]:.3f}s', file=sys.stderr)
+    return value
+
+
+def make_swissprot_xml(uniprot_acs):
+    entries = ''.join(f'<entry><accession>{ac}</accession></entry>' for ac in uniprot_acs)
+    return io.BytesIO(f'<uniprot xmlns="http://uniprot.org/uniprot">{entries}</uniprot>'.encode())
+
+# runs the swiss-prot import against the fixture and rolls it back, so that the
+# benchmark can be repeated on the same database
+def update_swissprot(uniprot_acs):
+    with stringdb.get_docker_session().connection() as conn:
+        with conn.cursor() as cursor:
+            import_swissprot.create_column(cursor)
+            import_swissprot.parse_xml(cursor, make_swissprot_xml(uniprot_acs))
+
+        conn.rollback()
+
+    return uniprot_acs
+
+def get_virus_host_networks(host_species_id):
+    with stringdb.get_docker_session().cursor() as cursor:
+        return stringdb_virus.get_virus_host_networks(cursor, host_species_id, range(1, 14))
+
+def compute_matrix(measure, split_annotations, n_workers, tile_size, comparer=None):
+    store = go_tools.make_comparison_store(split_annotations)
+
+    for _ in go_tools.iter_comparison_row_blocks(measure, split_annotations, store, n_workers, tile_size, comparer=comparer):
+        pass
+
+    return store
+
+def count_sample_annotations(is_a, evidence_codes, go_ids):
+    with go_tools.make_annotation_counter('stringdb', is_a, evidence_codes) as count_annotations:
+        return [count_annotations(go) for go in go_ids]
+
+
+def run_benchmarks(info, obo_path, freqs_path, measure, n_workers, n_semsim_prots, tile_size):
+    results = {}
+
+    host_species_id = info['host_species_id']
+    evidence_codes = go_tools.godb.get_curated_evidence_codes()
+
+    go_onto, _, _ = bench(results, 'load_obo', go_tools.load_obo_graphs, obo_path)
+
+    bench(results, 'ontology_bundle', go_tools.get_ontology_bundle)
+    is_a = bench(results, 'load_is_a_edges', go_tools.load_is_a_edges)
+
+    annotations = bench(results, 'annotation_fetch',
+        go_tools.get_all_annotations_for_species, 'stringdb', host_species_id, evidence_codes)
+
+    freqs = bench(results, 'curated_frequencies_set_based',
+        lambda: list(go_tools.get_curated_frequencies_set_based('stringdb', is_a, evidence_codes)))
+
+    with open(freqs_path, 'w') as freqs_f:
+        freqs_f.writelines(f'{go}\t{cnt}\n' for go, cnt in freqs)
+
+    bench(results, 'count_annotations',
+        count_sample_annotations, is_a, evidence_codes, info['go_terms'][::max(1, len(info['go_terms']) // 200)])
+
+    split_annotations = bench(results, 'namespace_split',
+        go_tools.classify_annotations_by_namespace, annotations, go_onto)
+
+    split_annotations = split_annotations[:n_semsim_prots]
+
+    store = bench(results, 'semsim_matrix',
+        compute_matrix, measure, split_annotations, n_workers, tile_size)
+
+    comparer = bench(results, 'semsim_term_tables',
+        go_tools.build_batch_comparer, measure, split_annotations, n_workers, tile_size)
+
+    bench(results, 'semsim_matrix_batched',
+        compute_matrix, measure, split_annotations, n_workers, tile_size, comparer)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        for fmt in ('tsv', 'npz', 'parquet'):
+            bench(results, f'write_matrix_{fmt}',
+                go_tools.write_comparison_blocks, split_annotations, store.iter_row_blocks(), path.join(out_dir, f'matrix.{fmt}'), fmt)
+
+    bench(results, 'virus_host_networks', get_virus_host_networks, host_species_id)
+
+    bench(results, 'swissprot_update', update_swissprot, info['uniprot_acs'][::2])
+
+    return results
+
+
+if __name__ == '__main__':
+    args, options = go_tools.parse_options(sys.argv)
+
+    scale = fixture.FixtureScale(float(options.get('scale', 1)))
+    dbname = options.get('dbname', 'stringdb_bench')
+    work_dir = options.get('work-dir', path.join(go_closure.get_cache_dir(), 'benchmarks'))
+
+    obo_path = path.join(work_dir, 'go.obo')
+    freqs_path = path.join(work_dir, 'go_curated_frequencies.tab')
+    info_path = path.join(work_dir, 'fixture.json')
+
+    os.environ['STRINGDB_DBNAME'] = dbname
+    os.environ['GO_OBO_PATH'] = obo_path
+    os.environ['GO_CURATED_FREQUENCIES_PATH'] = freqs_path
+
+    results = {}
+
+    if 'skip-fixture' in options:
+        with open(info_path) as info_f:
+            info = json.load(info_f)
+    else:
+        os.makedirs(work_dir, exist_ok=True)
+        info = bench(results, 'fixture', fixture.create_fixture, dbname, obo_path, scale)
+
+        with open(info_path, 'w') as info_f:
+            json.dump(info, info_f)
+
+    results.update(run_benchmarks(info, obo_path, freqs_path,
+        measure=options.get('measure', 'hrss'),
+        n_workers=int(options.get('workers', os.cpu_count())),
+        n_semsim_prots=int(options.get('semsim-prots', 500)),
+        tile_size=int(options.get('tile-size', 128))))
+
+    commit = get_commit()
+    report = {
+        'commit': commit,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'scale': info.get('scale', scale.as_dict()),
+        'rows': info['rows'],
+        'results': results}
+
+    output_path = options.get('output', path.join(benchmarks_dir, 'results', f'{commit}.json'))
+    os.makedirs(path.dirname(path.abspath(output_path)), exist_ok=True)
+
+    with open(output_path, 'w') as output_f:
+        json.dump(report, output_f, indent=2)
+
+    print(f'results written to {output_path}', file=sys.stderr)
@@ -0,0 +1,11 @@
+# splits argv into positional arguments and a dict of --name[=value] options
+def parse_options(argv):
+    args = [arg for arg in argv if not arg.startswith('--')]
+    options = {}
+
+    for arg in argv:
+        if arg.startswith('--'):
+            name, _, value = arg[2:].partition('=')
+            options[name] = value
+
+    return args, options
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+from os import path
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+import hashlib
+import http.client
+import os
+import shutil
+import sys
+import time
+
+import cli
+
+
+CHUNK_SIZE = 1 << 20
+
+
+def get_download_dir():
+    script_dir = path.dirname(path.realpath(__file__))
+    stringdb_dir = path.dirname(script_dir)
+
+    return os.environ.get('STRINGDB_DOWNLOAD_DIR', path.join(stringdb_dir, 'cache', 'downloads'))
+
+
+def get_cached_path(url, download_dir=None):
+    url_digest = hashlib.sha1(url.encode()).hexdigest()[:16]
+    return path.join(download_dir or get_download_dir(), f'{url_digest}-{path.basename(url)}')
+
+def hash_file(file_path, digest=None):
+    digest = digest or hashlib.sha256()
+
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    return digest
+
+def read_checksum(file_path):
+    checksum_path = file_path + '.sha256'
+
+    if not path.exists(checksum_path):
+        return None
+
+    with open(checksum_path) as checksum_f:
+        return checksum_f.read().split()[0]
+
+def write_checksum(file_path, checksum):
+    with open(file_path + '.sha256', 'w') as checksum_f:
+        print(checksum, path.basename(file_path), file=checksum_f)
+
+
+# copies the bytes of a download to out as they arrive. n_written outlives
+# retries, so bytes that are downloaded again after a server ignored the
+# resume range are not written twice.
+class StreamSink:
+    def __init__(self, out):
+        self.out = out
+        self.n_written = 0
+
+    def write_at(self, offset, chunk):
+        if offset + len(chunk) > self.n_written:
+            self.out.write(chunk[max(0, self.n_written - offset):])
+            self.n_written = offset + len(chunk)
+
+# appends the rest of url to part_path, asking the server to resume from the
+# bytes already downloaded. Servers that ignore the range answer with the
+# whole file, which then replaces the partial one.
+def fetch_part(url, part_path, digest, sink=None):
+    offset = path.getsize(part_path) if path.exists(part_path) else 0
+    request = Request(url, headers={'Range': f'bytes={offset}-'} if offset > 0 else {})
+
+    try:
+        response = urlopen(request)
+    except HTTPError as e:
+        # range past the end: the partial file is already complete
+        if e.code == 416 and offset > 0:
+            return digest
+        raise
+
+    with response:
+        if offset > 0 and response.status != 206:
+            offset = 0
+            digest = hashlib.sha256()
+
+        with open(part_path, 'ab' if offset > 0 else 'wb') as part_f:
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                part_f.write(chunk)
+                digest.update(chunk)
+
+                if sink is not None:
+                    sink.write_at(offset, chunk)
+
+                offset += len(chunk)
+                print(f'\rdownloading {path.basename(url)}: {offset / 1024**2:.0f} MiB', end='', file=sys.stderr)
+
+        # read(n) returns b'' when the connection drops before the announced
+        # length, so the remaining length tells truncated transfers apart
+        if response.length:
+            raise http.client.IncompleteRead(b'', response.length)
+
+    print('', file=sys.stderr)
+    return digest
+
+def copy_file(file_path, out):
+    with open(file_path, 'rb') as f:
+        shutil.copyfileobj(f, out, CHUNK_SIZE)
+
+# with out, the file is also written to out while it is downloaded, so that a
+# consumer can start before the download ends. A checksum mismatch is then
+# only detected after the data was written, and reported by the exception.
+def download(url, sha256=None, download_dir=None, max_retries=None, verify=False, out=None):
+    file_path = get_cached_path(url, download_dir)
+    part_path = file_path + '.part'
+
+    if path.exists(file_path):
+        checksum = read_checksum(file_path)
+
+        if not verify or hash_file(file_path).hexdigest() == checksum:
+            if sha256 is None or sha256 == checksum:
+                if out is not None:
+                    copy_file(file_path, out)
+
+                return file_path
+
+        print(f'checksum mismatch for cached {url}, downloading again', file=sys.stderr)
+        os.remove(file_path)
+
+    os.makedirs(path.dirname(file_path), exist_ok=True)
+
+    digest = hash_file(part_path) if path.exists(part_path) else hashlib.sha256()
+    sink = StreamSink(out) if out is not None else None
+    n_retries = 0
+
+    if sink is not None and path.exists(part_path):
+        copy_file(part_path, out)
+        sink.n_written = path.getsize(part_path)
+
+    while True:
+        try:
+            digest = fetch_part(url, part_path, digest, sink)
+            break
+        except (URLError, http.client.HTTPException, ConnectionError, TimeoutError) as e:
+            # client errors such as 404 or 403 do not go away by retrying
+            if isinstance(e, HTTPError) and 400 <= e.code < 500:
+                raise
+
+            n_retries += 1
+
+            if max_retries is not None and n_retries > max_retries:
+                raise
+
+            print(f'download of {url} interrupted ({e}), resuming', file=sys.stderr)
+            time.sleep(min(60, 2 ** n_retries))
+
+            # the failed fetch may have left bytes that were not hashed yet
+            digest = hash_file(part_path) if path.exists(part_path) else hashlib.sha256()
+
+    checksum = digest.hexdigest()
+
+    if sha256 is not None and checksum != sha256:
+        os.remove(part_path)
+        raise ValueError(f'checksum mismatch for {url}: {checksum} != {sha256}')
+
+    write_checksum(file_path, checksum)
+    os.replace(part_path, file_path)
+
+    return file_path
+
+
+if __name__ == '__main__':
+    args, options = cli.parse_options(sys.argv)
+
+    cmd = args[1]
+
+    if cmd == 'fetch':
+        file_path = download(args[2], sha256=options.get('sha256'), verify='verify' in options)
+        print(file_path)
+
+    elif cmd == 'cat':
+        download(args[2], sha256=options.get('sha256'), verify='verify' in options, out=sys.stdout.buffer)
+        sys.stdout.buffer.flush()
+
+    else:
+        print('unknown command:', cmd, file=sys.stderr)
@@ -37,20 +37,13 @@ then
         select
           node_id_a,
           node_id_b,
-          evidence_scores[i][2] evidence_score
-        from (
-          select
-            node_id_a,
-            node_id_b,
-            evidence_scores,
-            generate_subscripts(evidence_scores, 1) as i
-          from
-            network.node_node_links
-          where
-            node_type_b = $taxo_id
-        ) as indexed_scores
+          score evidence_score
+        from
+          network.evidence_scores
         where
-          evidence_scores[i][1] = $evtype
+          node_type_b = $taxo_id
+          and
+          score_type = $evtype
     ) to '$out_file' with csv header delimiter E'\\t';
     "
 elif [ $# = 4 ]
@@ -62,22 +55,15 @@ then
         select
           node_id_a,
           node_id_b,
-          evidence_scores[i][2] evidence_score
-        from (
-          select
-            node_id_a,
-            node_id_b,
-            evidence_scores,
-            generate_subscripts(evidence_scores, 1) as i
-          from
-            network.node_node_links
-          where
-            node_type_b = $taxo_id
-        ) as indexed_scores
+          score evidence_score
+        from
+          network.evidence_scores
         where
-          evidence_scores[i][1] = $evtype
+          node_type_b = $taxo_id
+          and
+          score_type = $evtype
           and
-          evidence_scores[i][2] >= $scorethreshold
+          score >= $scorethreshold
     ) to '$out_file' with csv header delimiter E'\\t';
     "
 fi
@@ -0,0 +1,147 @@
+import io
+import sys
+
+import cli
+import instrument
+import stringdb
+
+
+def get_network_query(cursor, species_id, score_type=None, min_score=None, swissprot_only=False):
+    params = {'species_id': species_id, 'score_type': score_type, 'min_score': min_score}
+
+    if swissprot_only:
+        swissprot_filter = """
+          and
+          node_id_a in (select string_id from swissprot)
+          and
+          node_id_b in (select string_id from swissprot)"""
+    else:
+        swissprot_filter = ''
+
+    if score_type is None:
+        score_filter = '' if min_score is None else """
+          and
+          combined_score >= %(min_score)s"""
+
+        query = f"""
+        select
+          node_id_a,
+          node_id_b,
+          combined_score score
+        from
+          network.node_node_links
+        where
+          node_type_b = %(species_id)s{score_filter}{swissprot_filter}"""
+
+    else:
+        score_filter = '' if min_score is None else """
+          and
+          score >= %(min_score)s"""
+
+        query = f"""
+        select
+          node_id_a,
+          node_id_b,
+          score
+        from
+          network.evidence_scores
+        where
+          node_type_b = %(species_id)s
+          and
+          score_type = %(score_type)s{score_filter}{swissprot_filter}"""
+
+    if swissprot_only:
+        query = """
+        with swissprot as (
+          select
+            string_id
+          from
+            mapping.uniprot
+          where
+            species_id = %(species_id)s
+          group by
+            string_id
+          having
+            bool_and(swiss_prot)
+        )""" + query
+
+    return cursor.mogrify(query, params).decode()
+
+
+# file-like target for copy_expert: buffers the csv stream and converts every
+# batch of complete lines into a parquet row group
+class ParquetCopySink:
+    def __init__(self, out_path, schema, batch_bytes=64 * 1024**2):
+        import pyarrow.parquet as pq
+
+        self.schema = schema
+        self.batch_bytes = batch_bytes
+        self.writer = pq.ParquetWriter(out_path, schema, compression='zstd')
+
+        self.chunks = []
+        self.size = 0
+        self.n_rows = 0
+        self.progress = instrument.Progress('exporting links', unit='links')
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+
+        self.chunks.append(data)
+        self.size += len(data)
+
+        if self.size >= self.batch_bytes:
+            self.flush_lines()
+
+    def flush_lines(self, final=False):
+        import pyarrow.csv as pa_csv
+
+        data = b''.join(self.chunks)
+        cut = len(data) if final else data.rfind(b'\n') + 1
+
+        self.chunks = [data[cut:]]
+        self.size = len(data) - cut
+
+        if cut > 0:
+            table = pa_csv.read_csv(
+                io.BytesIO(data[:cut]),
+                read_options=pa_csv.ReadOptions(column_names=self.schema.names),
+                convert_options=pa_csv.ConvertOptions(column_types=self.schema))
+
+            self.writer.write_table(table)
+            self.n_rows += table.num_rows
+            self.progress.update(table.num_rows)
+
+    def close(self):
+        self.flush_lines(final=True)
+        self.writer.close()
+        self.progress.close()
+
+
+def export_network(cursor, out_path, species_id, score_type=None, min_score=None, swissprot_only=False):
+    import pyarrow as pa
+
+    schema = pa.schema([('node_id_a', pa.int64()), ('node_id_b', pa.int64()), ('score', pa.int32())])
+    query = get_network_query(cursor, species_id, score_type, min_score, swissprot_only)
+
+    sink = ParquetCopySink(out_path, schema)
+
+    try:
+        cursor.copy_expert(f'copy ({query}) to stdout with (format csv)', sink)
+    finally:
+        sink.close()
+
+    return sink.n_rows
+
+
+if __name__ == '__main__':
+    args, options = cli.parse_options(sys.argv)
+
+    species_id = int(args[1])
+    output_path = args[2]
+
+    score_type = int(options['score-type']) if 'score-type' in options else None
+    min_score = int(options['threshold']) if 'threshold' in options else None
+
+    with stringdb.get_docker_session().cursor() as cursor:
+        export_network(cursor, output_path, species_id, score_type, min_score, 'swissprot' in options)
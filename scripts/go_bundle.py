@@ -0,0 +1,118 @@
+from os import path
+import hashlib
+import networkx as nx
+import numpy as np
+import os
+import pickle
+import shutil
+import sys
+
+import go_closure
+import geneontology as godb
+import semantic_similarity as semsim
+
+
+NAMESPACES = ('biological_process', 'cellular_component', 'molecular_function')
+
+# bumped whenever the files of a bundle change, so that older bundles in the
+# cache are rebuilt instead of read
+BUNDLE_VERSION = 3
+
+ARRAY_NAMES = ('terms', 'namespaces', 'is_a_terms', 'is_a_indptr', 'is_a_indices')
+OBJECT_NAMES = ('go_onto', 'go_is_a_g', 'go_alt_id_g', 'ic')
+
+
+def get_files_digest(*file_paths):
+    digest = hashlib.sha1()
+
+    for file_path in file_paths:
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+
+    return digest.hexdigest()[:16]
+
+
+def get_term_namespace_code(term):
+    for namespace in term.other.get('namespace', []):
+        if namespace in NAMESPACES:
+            return NAMESPACES.index(namespace)
+
+    return -1
+
+
+# prebuilt ontology, keyed by the digest of the OBO and curated frequencies
+# files it was built from. The sorted term ids with their namespace codes, and
+# the is_a edges as go_closure.IsAEdges arrays, are stored as .npy files and
+# memory-mapped on access. The pronto ontology, the is_a and alt_id graphs and
+# the IC table (as needed by semantic_similarity and the geneontology helpers)
+# are pickled separately, and each is only unpickled when first used.
+class OntologyBundle:
+    def __init__(self, bundle_dir):
+        self.bundle_dir = bundle_dir
+        self._loaded = {}
+
+    def __getattr__(self, name):
+        if name not in ARRAY_NAMES and name not in OBJECT_NAMES:
+            raise AttributeError(name)
+
+        if name not in self._loaded:
+            if name in ARRAY_NAMES:
+                self._loaded[name] = np.load(path.join(self.bundle_dir, f'{name}.npy'), mmap_mode='r')
+            else:
+                with open(path.join(self.bundle_dir, f'{name}.pickle'), 'rb') as f:
+                    self._loaded[name] = pickle.load(f)
+
+        return self._loaded[name]
+
+
+def build_bundle(bundle_dir, obo_path, curated_frequencies_path):
+    import pronto
+
+    go_onto = pronto.Ontology(obo_path)
+    go_is_a_g = godb.onto_rel_graph(go_onto)
+
+    assert len(list(nx.weakly_connected_components(go_is_a_g))) == 3
+
+    onto_terms = sorted(go_onto, key=lambda term: term.id)
+    is_a = go_closure.IsAEdges.from_graph(go_is_a_g)
+
+    arrays = {
+        'terms': np.array([term.id for term in onto_terms]),
+        'namespaces': np.array([get_term_namespace_code(term) for term in onto_terms], dtype=np.int8),
+        'is_a_terms': is_a.terms,
+        'is_a_indptr': is_a.indptr,
+        'is_a_indices': is_a.indices
+    }
+
+    objects = {
+        'go_onto': go_onto,
+        'go_is_a_g': go_is_a_g,
+        'go_alt_id_g': godb.onto_alt_id_graph(go_onto, go_is_a_g),
+        'ic': semsim.init_ic(go_onto, curated_frequencies_path)
+    }
+
+    tmp_dir = bundle_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    for name, array in arrays.items():
+        np.save(path.join(tmp_dir, f'{name}.npy'), array)
+
+    for name, obj in objects.items():
+        with open(path.join(tmp_dir, f'{name}.pickle'), 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.replace(tmp_dir, bundle_dir)
+
+def load_bundle(obo_path, curated_frequencies_path, cache_dir):
+    digest = get_files_digest(obo_path, curated_frequencies_path)
+    bundle_dir = path.join(cache_dir, f'go_bundle_v{BUNDLE_VERSION}_{digest}')
+
+    if not path.exists(bundle_dir):
+        print('building GO ontology bundle... ', end='', file=sys.stderr)
+        os.makedirs(cache_dir, exist_ok=True)
+        build_bundle(bundle_dir, obo_path, curated_frequencies_path)
+        print('done', file=sys.stderr)
+
+    return OntologyBundle(bundle_dir)
@@ -0,0 +1,178 @@
+from os import path
+import hashlib
+import numpy as np
+import os
+import sys
+
+
+def get_cache_dir():
+    script_dir = path.dirname(path.realpath(__file__))
+    stringdb_dir = path.dirname(script_dir)
+
+    return path.join(stringdb_dir, 'cache')
+
+
+# is_a edges as CSR arrays over the sorted term ids: the parents of the term
+# with code i are indices[indptr[i]:indptr[i+1]]. The ontology bundle stores
+# them as .npy files, so that they can be memory-mapped instead of unpickling
+# the networkx graph.
+class IsAEdges:
+    def __init__(self, terms, indptr, indices):
+        self.terms = terms
+        self.indptr = indptr
+        self.indices = indices
+
+        self.term_codes = {go: i for i, go in enumerate(terms.tolist())}
+
+    def __len__(self):
+        return len(self.terms)
+
+    @classmethod
+    def from_graph(cls, go_is_a_g):
+        terms = np.array(sorted(go_is_a_g.nodes()))
+        term_codes = {go: i for i, go in enumerate(terms.tolist())}
+
+        parents = [[term_codes[parent] for parent in go_is_a_g.successors(go)] for go in terms.tolist()]
+
+        return cls(terms, *_to_csr(parents))
+
+    def parent_codes(self, code):
+        return self.indices[self.indptr[code]:self.indptr[code+1]]
+
+    def children(self):
+        return _transpose_csr(self.indptr, self.indices, len(self.terms))
+
+    # term codes ordered so that every term comes after all of its children
+    def topological_codes(self):
+        n_children = np.bincount(self.indices, minlength=len(self.terms)).tolist()
+        order = [code for code, n in enumerate(n_children) if n == 0]
+
+        for code in order:
+            for parent in self.parent_codes(code).tolist():
+                n_children[parent] -= 1
+                if n_children[parent] == 0:
+                    order.append(parent)
+
+        assert len(order) == len(self.terms), 'is_a graph has a cycle'
+        return order
+
+    # digest of the term set and is_a edges, so that the closure index is
+    # rebuilt whenever a different ontology release is loaded
+    def get_version(self):
+        digest = hashlib.sha1()
+        terms = self.terms.tolist()
+
+        for go in terms:
+            digest.update(f'{go}\n'.encode())
+
+        for code, go in enumerate(terms):
+            for parent in self.parent_codes(code).tolist():
+                digest.update(f'{go} {terms[parent]}\n'.encode())
+
+        return digest.hexdigest()[:16]
+
+def get_graph_version(go_g):
+    return IsAEdges.from_graph(go_g).get_version()
+
+
+# ancestors/descendants follow the networkx convention on the is_a graph
+# (edges point from child to parent): ancestors(go) are the terms with a path
+# to go, descendants(go) are the terms reachable from go.
+class ClosureIndex:
+    def __init__(self, terms, anc_indptr, anc_indices, desc_indptr, desc_indices):
+        self.terms = terms
+        self.anc_indptr = anc_indptr
+        self.anc_indices = anc_indices
+        self.desc_indptr = desc_indptr
+        self.desc_indices = desc_indices
+
+        self.term_codes = {go: i for i, go in enumerate(terms.tolist())}
+
+    def __contains__(self, go_id):
+        return go_id in self.term_codes
+
+    def __len__(self):
+        return len(self.terms)
+
+    def ancestor_codes(self, code):
+        return self.anc_indices[self.anc_indptr[code]:self.anc_indptr[code+1]]
+
+    def descendant_codes(self, code):
+        return self.desc_indices[self.desc_indptr[code]:self.desc_indptr[code+1]]
+
+    def ancestors(self, go_id):
+        return self.terms[self.ancestor_codes(self.term_codes[go_id])].tolist()
+
+    def descendants(self, go_id):
+        return self.terms[self.descendant_codes(self.term_codes[go_id])].tolist()
+
+    def save(self, index_path):
+        np.savez(index_path,
+                 terms=self.terms,
+                 anc_indptr=self.anc_indptr,
+                 anc_indices=self.anc_indices,
+                 desc_indptr=self.desc_indptr,
+                 desc_indices=self.desc_indices)
+
+    @classmethod
+    def load(cls, index_path):
+        with np.load(index_path, allow_pickle=False) as arrays:
+            return cls(arrays['terms'],
+                       arrays['anc_indptr'],
+                       arrays['anc_indices'],
+                       arrays['desc_indptr'],
+                       arrays['desc_indices'])
+
+
+def _to_csr(sets):
+    indptr = np.zeros(len(sets) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(s) for s in sets])
+
+    indices = np.empty(indptr[-1], dtype=np.int32)
+    for code, s in enumerate(sets):
+        indices[indptr[code]:indptr[code+1]] = sorted(s)
+
+    return indptr, indices
+
+def _transpose_csr(indptr, indices, n):
+    rows = np.repeat(np.arange(n, dtype=np.int32), np.diff(indptr))
+    order = np.lexsort((rows, indices))
+
+    t_indptr = np.zeros(n + 1, dtype=np.int64)
+    t_indptr[1:] = np.cumsum(np.bincount(indices, minlength=n))
+
+    return t_indptr, rows[order]
+
+def build_closure_index(is_a):
+    children_indptr, children_indices = is_a.children()
+    ancestors = [None] * len(is_a)
+
+    for code in is_a.topological_codes():
+        code_ancestors = set()
+
+        for child in children_indices[children_indptr[code]:children_indptr[code+1]].tolist():
+            code_ancestors.add(child)
+            code_ancestors.update(ancestors[child])
+
+        ancestors[code] = code_ancestors
+
+    anc_indptr, anc_indices = _to_csr(ancestors)
+    desc_indptr, desc_indices = _transpose_csr(anc_indptr, anc_indices, len(is_a))
+
+    return ClosureIndex(np.asarray(is_a.terms), anc_indptr, anc_indices, desc_indptr, desc_indices)
+
+def load_closure_index(is_a, cache_dir=None):
+    cache_dir = cache_dir or get_cache_dir()
+    index_path = path.join(cache_dir, f'go_closure_{is_a.get_version()}.npz')
+
+    if path.exists(index_path):
+        return ClosureIndex.load(index_path)
+
+    print('building GO closure index... ', end='', file=sys.stderr)
+    closure = build_closure_index(is_a)
+    print('done', file=sys.stderr)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    closure.save(index_path)
+
+    return closure
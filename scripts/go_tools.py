@@ -1,18 +1,38 @@
 from os import path
+import collections
+import contextlib
 import csv
+import functools
+import hashlib
 import itertools
 import math
+import multiprocessing
 import networkx as nx
 import numpy as np
+import os
+import pandas as pd
+import random
+import shutil
 import sys
+import tempfile
 import time
 
+import cli
+import go_bundle
+import go_closure
+import instrument
+import semsim_batch
+import semsim_storage
 import stringdb
+import stringdb_cache
 import geneontology as godb
 import semantic_similarity as semsim
 
 
 def get_curated_frequencies_path():
+    if 'GO_CURATED_FREQUENCIES_PATH' in os.environ:
+        return os.environ['GO_CURATED_FREQUENCIES_PATH']
+
     script_dir = path.dirname(path.realpath(__file__))
     stringdb_dir = path.dirname(script_dir)
 
@@ -24,19 +44,105 @@ def load_go_list(fd):
     return [go_id.strip() for go_id in fd.readlines() if not go_id.isspace()]
 
 
+def get_go_obo_path():
+    return os.environ.get('GO_OBO_PATH')
+
+# the bundle is built from, and keyed by, the OBO file that GO_OBO_PATH names
+@functools.lru_cache(maxsize=None)
+def get_ontology_bundle():
+    obo_path = get_go_obo_path()
+
+    if obo_path is None:
+        return None
+
+    return go_bundle.load_bundle(obo_path, get_curated_frequencies_path(), go_closure.get_cache_dir())
+
+def load_default_ontology():
+    bundle = get_ontology_bundle()
+
+    if bundle is None:
+        go_onto = godb.load_go_obo()
+        go_is_a_g = godb.onto_rel_graph(go_onto)
+        ic = semsim.init_ic(go_onto, get_curated_frequencies_path())
+
+        return go_onto, go_is_a_g, ic
+
+    return bundle.go_onto, bundle.go_is_a_g, bundle.ic
+
+def load_ontology_graphs():
+    bundle = get_ontology_bundle()
+
+    if bundle is None:
+        with instrument.phase('load_obo'):
+            go_onto = godb.load_go_obo()
+            go_is_a_g = godb.onto_rel_graph(go_onto)
+
+        assert len(list(nx.weakly_connected_components(go_is_a_g))) == 3
+
+        return go_onto, go_is_a_g, None
+
+    with instrument.phase('load_bundle_graphs'):
+        return bundle.go_onto, bundle.go_is_a_g, bundle.go_alt_id_g
+
+# memory-maps the is_a edge arrays of the bundle, without unpickling any of
+# its objects
+def load_is_a_edges():
+    bundle = get_ontology_bundle()
+
+    if bundle is None:
+        return go_closure.IsAEdges.from_graph(load_ontology_graphs()[1])
+
+    with instrument.phase('load_bundle_is_a_edges'):
+        return go_closure.IsAEdges(bundle.is_a_terms, bundle.is_a_indptr, bundle.is_a_indices)
+
+
 def init_default_hrss(agg = semsim.agg_bma_max):
-    go_onto = godb.load_go_obo()
-    go_is_a_g = godb.onto_rel_graph(go_onto)
-    ic = semsim.init_ic(go_onto, get_curated_frequencies_path())
+    go_onto, go_is_a_g, ic = load_default_ontology()
 
     return semsim.HRSS(agg=agg, onto=go_onto, rel_g=go_is_a_g, ic=ic)
 
 def init_default_mica_dissim(agg = semsim.agg_bma_min):
-    onto = godb.load_go_obo()
-    go_is_a_g = godb.onto_rel_graph(go_onto)
-    ic = semsim.init_ic(go_onto, get_curated_frequencies_path())
+    go_onto, go_is_a_g, ic = load_default_ontology()
+
+    return semsim.MICADissim(agg=agg, onto=go_onto, rel_g=go_is_a_g, ic=ic)
+
+def init_comparison_object(measure):
+    if measure == 'mica-dissim':
+        return init_default_mica_dissim()
+    elif measure == 'hrss':
+        return init_default_hrss()
+    else:
+        raise ValueError(f'unknown (dis)similarity measure: {measure}')
+
 
-    return semsim.MICADissim(agg=agg, onto=onto, rel_g=go_is_a_g, ic=ic)
+parse_options = cli.parse_options
+
+USAGE = """\
+usage: go_tools.py <command> <args> [--option[=value] ...]
+
+  alternatives <go-list> <output>
+  curated-frequencies <source> <output> [--engine=set-based|per-term] [--check[=n]]
+  update-ontology <old-obo> [--engine=set-based|per-term] [--dry-run]
+  namespace-ann-counts <source> <species-id> <output> [--cache]
+  semsim-matrix <measure> <source> <species-id> <output> [--cache]
+      [--workers=n] [--tile-size=n] [--engine=batched [--check[=n]]]
+      [--dtype=float64|float32] [--layout=dense|packed] [--store=path] [--checkpoint=dir]
+      [--format=tsv|npz|parquet] [--upper] [--threshold=x]
+  semsim-export <store> <output> [--format=tsv|npz|parquet] [--upper] [--threshold=x --measure=m]
+
+The ontology bundle is only used when GO_OBO_PATH names the OBO file; without
+it, every run parses the OBO through geneontology. The bundle memory-maps the
+term namespaces and is_a edges, which is all that curated-frequencies,
+namespace-ann-counts and semsim-matrix checkpoints read. The semsim measures,
+alternatives and update-ontology still unpickle the pronto ontology, graphs
+and IC table, so their startup is bound by unpickling and is not under a
+second.
+
+semsim-matrix runs in a single process unless --workers is given; every
+worker loads its own copy of the ontology. Without --store or --checkpoint
+the whole matrix is held in memory, in the packed layout by default;
+--store=path keeps it in a memory-mapped file instead, which bounds the
+memory that semsim-matrix needs."""
 
 
 def open_arg_file(path, mode):
@@ -49,70 +155,302 @@ def open_arg_file(path, mode):
         return open(path, mode)
 
 
-def find_valid_go_alternatives(go_list, go_onto, go_is_a_g, evidence_codes):
-    go_missing = [go for go in go_list if go not in go_is_a_g]
-    assert all(godb.is_obsolete(go, go_onto) for go in go_missing)
-    assert all(godb.is_disconnected(go, go_onto) for go in go_missing)
+def get_alternatives_table_path():
+    return path.join(go_closure.get_cache_dir(), 'go_alternatives_resolved.tab')
+
+def get_alternatives_version(go_is_a_g=None, go_alt_id_g=None):
+    obo_path = get_go_obo_path()
+
+    if obo_path is not None:
+        return go_bundle.get_files_digest(obo_path)
+    else:
+        return go_closure.get_graph_version(go_is_a_g) + go_closure.get_graph_version(go_alt_id_g)
 
+# first valid alternative (as found by geneontology.find_valid_alternatives)
+# of every term and alt id of the ontology, None for those without a valid one
+def build_alternatives_table(go_onto, go_is_a_g, go_alt_id_g):
+    go_ids = sorted({term.id for term in go_onto} | set(go_alt_id_g.nodes()))
+    table = {}
+
+    for go in go_ids:
+        alt_ids = godb.find_valid_alternatives(go, alt_id_g=go_alt_id_g, rel_g=go_is_a_g)
+        table[go] = alt_ids[0] if alt_ids else None
+
+    return table
+
+def save_alternatives_table(table_path, version, table):
+    tmp_path = table_path + '.tmp'
+    os.makedirs(path.dirname(table_path), exist_ok=True)
+
+    with open(tmp_path, 'w') as table_f:
+        print(f'# {version}', file=table_f)
+
+        for go, alt_id in table.items():
+            print(f'{go}\t{alt_id or ""}', file=table_f)
+
+    os.replace(tmp_path, table_path)
+
+def load_alternatives_table(table_path, version):
+    if not path.exists(table_path):
+        return None
+
+    with open(table_path) as table_f:
+        if table_f.readline().rstrip('\n') != f'# {version}':
+            return None
+
+        return {go: alt_id or None for go, alt_id in (line.rstrip('\n').split('\t') for line in table_f)}
+
+def get_alternatives_table(load_graphs):
+    table_path = get_alternatives_table_path()
+    table = None
+
+    if get_go_obo_path() is not None:
+        version = get_alternatives_version()
+        table = load_alternatives_table(table_path, version)
+
+    if table is None:
+        go_onto, go_is_a_g, go_alt_id_g = load_graphs()
+
+        if go_alt_id_g is None:
+            go_alt_id_g = godb.onto_alt_id_graph(go_onto, go_is_a_g)
+
+        version = get_alternatives_version(go_is_a_g, go_alt_id_g)
+        table = load_alternatives_table(table_path, version)
+
+    if table is None:
+        print('resolving GO alternatives... ', end='', file=sys.stderr)
+        table = build_alternatives_table(go_onto, go_is_a_g, go_alt_id_g)
+        save_alternatives_table(table_path, version, table)
+        print('done', file=sys.stderr)
+
+    return table
+
+def load_obo_graphs(obo_path):
+    import pronto
+
+    go_onto = pronto.Ontology(obo_path)
+    go_is_a_g = godb.onto_rel_graph(go_onto)
     go_alt_id_g = godb.onto_alt_id_graph(go_onto, go_is_a_g)
 
-    go_no_alt_id       = [go for go in go_missing if list(godb.find_alternatives(go, alt_id_g=go_alt_id_g)) == [go]]
-    go_no_valid_alt_id = [go for go in go_missing if not godb.find_valid_alternatives(go, alt_id_g=go_alt_id_g, rel_g=go_is_a_g)]
+    return go_onto, go_is_a_g, go_alt_id_g
+
+# go ids whose resolved alternative differs between two releases, mapped to
+# their new alternative (None when they no longer have a valid one)
+def diff_alternatives_tables(old_table, new_table):
+    return {go: new_table.get(go)
+            for go in old_table.keys() | new_table.keys()
+            if old_table.get(go) != new_table.get(go)}
+
+# terms of the new ontology whose curated frequency may differ from the old one:
+# terms that were added or removed, children of added or removed is_a edges and
+# the old and new alternatives of remapped ids, together with their
+# GO-ancestors in either release
+def get_affected_terms(old_is_a_g, new_is_a_g, old_table, remapping):
+    seeds = set(old_is_a_g.nodes()) ^ set(new_is_a_g.nodes())
+    seeds.update(child for child, _ in set(old_is_a_g.edges()) ^ set(new_is_a_g.edges()))
+    seeds.update(old_table[go] for go in remapping if old_table.get(go) is not None)
+    seeds.update(alt_id for alt_id in remapping.values() if alt_id is not None)
+
+    old_closure = go_closure.load_closure_index(go_closure.IsAEdges.from_graph(old_is_a_g))
+    new_closure = go_closure.load_closure_index(go_closure.IsAEdges.from_graph(new_is_a_g))
+
+    affected = set()
 
-    for go in go_list:
-        for alt_id in godb.find_valid_alternatives(go, alt_id_g=go_alt_id_g, rel_g=go_is_a_g)[:1]:
-            yield go, alt_id
+    for go in seeds:
+        for closure in (old_closure, new_closure):
+            if go in closure:
+                affected.add(go)
+                affected.update(closure.descendants(go))
 
-    print(f'skipped {len(go_no_valid_alt_id)} terms with no valid alternative id\'s', file=sys.stderr)
+    affected &= set(new_is_a_g.nodes())
 
+    # terms that lost descendants in the new release can still pass the
+    # change on to their new GO-ancestors
+    for go in list(affected):
+        affected.update(new_closure.descendants(go))
+
+    return affected
+
+
+# ids that are not in the ontology at all are reported on stderr, and left out
+# of the output like the terms without a valid alternative
+def map_go_alternatives(in_f, out_f, table):
+    n_skipped = 0
+    unknown = []
+
+    for line in in_f:
+        go = line.strip()
+
+        if not go:
+            continue
+
+        if go not in table:
+            unknown.append(go)
+        elif table[go] is None:
+            n_skipped += 1
+        else:
+            out_f.write(f'{go}\t{table[go]}\n')
 
-def make_annotation_counter(source, go_is_a_g, evidence_codes):
+    print(f'skipped {n_skipped} terms with no valid alternative id\'s', file=sys.stderr)
+
+    if unknown:
+        print(f'skipped {len(unknown)} terms that are not in the ontology:', *unknown, file=sys.stderr)
+
+
+# the counter holds a connection, which is given back when the with block ends
+@contextlib.contextmanager
+def make_annotation_counter(source, is_a, evidence_codes):
     if source == 'stringdb':
-        conn = stringdb.connect_to_docker()
-        cursor = conn.cursor()
+        closure = go_closure.load_closure_index(is_a)
 
-        return lambda go: \
-            stringdb.count_annotations(cursor=cursor, go_is_a_g=go_is_a_g, go_id=go, evidence_codes=evidence_codes)
+        with stringdb.get_docker_session().cursor() as cursor:
+            yield lambda go: \
+                stringdb.count_annotations(cursor=cursor, go_is_a_g=None, go_id=go, evidence_codes=evidence_codes, closure=closure)
 
     elif source == 'geneontology':
         conn = godb.connect_to_docker()
         cursor = conn.cursor()
 
-        return lambda go: \
-            godb.count_protein_annotations(cursor, go, evidence_codes=evidence_codes)
+        try:
+            yield lambda go: \
+                godb.count_protein_annotations(cursor, go, evidence_codes=evidence_codes)
+        finally:
+            conn.close()
 
     else:
         raise ValueError(f'unknown source db of GO annotations: {source}')
 
 
-def get_curated_frequencies(source, go_is_a_g, evidence_codes):
-    count_annotations = make_annotation_counter(source, go_is_a_g, evidence_codes)
+def get_curated_frequencies(source, is_a, evidence_codes):
+    with make_annotation_counter(source, is_a, evidence_codes) as count_annotations, \
+            instrument.Progress('counting annotations', len(is_a), 'terms') as progress:
+        for go in is_a.terms.tolist():
+            go_cnt = count_annotations(go)
 
-    for i, go in enumerate(sorted(go_is_a_g.nodes())):
-        go_cnt = count_annotations(go)
+            progress.update()
+            yield go, go_cnt
 
-        print(f'{i}/{nx.number_of_nodes(go_is_a_g)} count {go} = {go_cnt}', file=sys.stderr)
-        yield go, go_cnt
 
+def propagate_annotation_counts(is_a, annotation_pairs):
+    explicit_prots = collections.defaultdict(list)
 
-def get_all_annotations_for_species(source, species_id, evidence_codes):
-    if source == 'stringdb':
-        with stringdb.connect_to_docker() as string_conn:
-            with string_conn.cursor() as string_cursor:
-                prots = stringdb.get_species_prots(string_cursor, species_id)
+    for go, string_id in annotation_pairs:
+        code = is_a.term_codes.get(go)
+        if code is not None:
+            explicit_prots[code].append(string_id)
+
+    # the topological order visits every term after all of its descendants.
+    # The protein set of a term is freed as soon as all of its parents have
+    # absorbed it.
+    children_indptr, children_indices = is_a.children()
+    terms = is_a.terms.tolist()
+
+    prots = {}
+    parents_left = np.diff(is_a.indptr).tolist()
+    counts = {}
+    progress = instrument.Progress('propagating annotations', len(is_a), 'terms')
+
+    for code in is_a.topological_codes():
+        progress.update()
+
+        children = children_indices[children_indptr[code]:children_indptr[code+1]].tolist()
+        code_prots = [np.array(explicit_prots.pop(code, []), dtype=np.int64)] + [prots[child] for child in children]
+
+        prots[code] = np.unique(np.concatenate(code_prots))
+        counts[terms[code]] = len(prots[code])
+
+        for child in children:
+            parents_left[child] -= 1
+            if parents_left[child] == 0:
+                del prots[child]
+
+        if parents_left[code] == 0:
+            del prots[code]
+
+    progress.close()
+    return counts
+
+def get_curated_frequencies_set_based(source, is_a, evidence_codes):
+    if source != 'stringdb':
+        raise ValueError(f'set-based frequencies are not supported for source: {source}')
+
+    with stringdb.get_docker_session().cursor('curated_frequencies') as string_cursor:
+        annotation_pairs = stringdb.get_all_explicit_annotations(string_cursor, evidence_codes)
+        counts = propagate_annotation_counts(is_a, annotation_pairs)
+
+    for go in is_a.terms.tolist():
+        yield go, counts[go]
+
+def check_curated_frequencies(source, is_a, evidence_codes, freqs, n_samples=None):
+    gos = sorted(freqs)
+    if n_samples is not None and n_samples < len(gos):
+        gos = random.sample(gos, n_samples)
+
+    mismatches = []
+
+    with make_annotation_counter(source, is_a, evidence_codes) as count_annotations, \
+            instrument.Progress('checking frequencies', len(gos), 'terms') as progress:
+        for go in gos:
+            go_cnt = count_annotations(go)
+            if go_cnt != freqs[go]:
+                mismatches.append((go, freqs[go], go_cnt))
+
+            progress.update()
+
+    return mismatches
+
+
+def load_curated_frequencies(freqs_path):
+    with open(freqs_path) as freqs_f:
+        return {go: int(cnt) for go, cnt in csv.reader(freqs_f, delimiter='\t')}
+
+# frequencies of the terms in affected are recomputed, the rest are kept from
+# old_freqs. The set-based engine only propagates annotations over the affected
+# terms and their GO-descendants, which is all their counts depend on.
+def update_curated_frequencies(source, go_is_a_g, evidence_codes, old_freqs, affected, engine='set-based'):
+    freqs = {go: cnt for go, cnt in old_freqs.items() if go in go_is_a_g and go not in affected}
+    is_a = go_closure.IsAEdges.from_graph(go_is_a_g)
+
+    if engine == 'set-based':
+        if source != 'stringdb':
+            raise ValueError(f'set-based frequencies are not supported for source: {source}')
+
+        closure = go_closure.load_closure_index(is_a)
+
+        subgraph_terms = set(affected)
+        for go in affected:
+            subgraph_terms.update(closure.ancestors(go))
+
+        with stringdb.get_docker_session().cursor('curated_frequencies') as string_cursor:
+            annotation_pairs = stringdb.get_all_explicit_annotations(string_cursor, evidence_codes)
+            counts = propagate_annotation_counts(go_closure.IsAEdges.from_graph(go_is_a_g.subgraph(subgraph_terms)), annotation_pairs)
+
+        freqs.update((go, counts[go]) for go in affected)
+
+    else:
+        with make_annotation_counter(source, is_a, evidence_codes) as count_annotations, \
+                instrument.Progress('counting annotations', len(affected), 'terms') as progress:
+            for go in sorted(affected):
+                freqs[go] = count_annotations(go)
+                progress.update()
+
+    return sorted(freqs.items())
 
-                annotations = []
 
-                for i, string_id in enumerate(prots):
-                    if i % 100 == 0:
-                        print(f'\rretrieving annotations ({i}/{len(prots)})... ', end='', file=sys.stderr)
+def get_all_annotations_for_species(source, species_id, evidence_codes, cache=None):
+    if source == 'stringdb' and cache is not None:
+        prots = cache.get_species_prots(species_id)
+        annotations = cache.get_species_explicit_annotations(species_id, evidence_codes)
 
-                    prot_gos = stringdb.get_explicit_prot_annotations(string_cursor, string_id, evidence_codes)
+    elif source == 'stringdb':
+        with stringdb.get_docker_session().cursor() as string_cursor, \
+                instrument.phase('retrieve_annotations', species_id=species_id):
+            print('retrieving annotations... ', end='', file=sys.stderr)
 
-                    if prot_gos:
-                        annotations.append((string_id, prot_gos))
+            prots = stringdb.get_species_prots(string_cursor, species_id)
+            annotations = stringdb.get_species_explicit_annotations(string_cursor, species_id, evidence_codes)
 
-                print('done', file=sys.stderr)
+            print('done', file=sys.stderr)
 
     else:
         raise ValueError(f'unknown source db of GO annotations: {source}')
@@ -124,46 +462,424 @@ def get_all_annotations_for_species(source, species_id, evidence_codes):
     return annotations
 
 
-def classify_annotations_by_namespace(annotations, onto):
-    for prot, gos in annotations:
-        yield (prot,
-                [go for go in gos if 'biological_process' in onto[go].other['namespace']],
-                [go for go in gos if 'cellular_component' in onto[go].other['namespace']],
-                [go for go in gos if 'molecular_function' in onto[go].other['namespace']])
+NAMESPACES = go_bundle.NAMESPACES
+
+# onto is only needed without a bundle, which holds the namespaces of all
+# terms; if it is not given, it is loaded then
+def get_term_namespaces(terms, onto=None):
+    bundle = get_ontology_bundle()
+
+    if bundle is None:
+        onto = onto if onto is not None else load_ontology_graphs()[0]
+        return np.array([go_bundle.get_term_namespace_code(onto[go]) for go in terms], dtype=np.int8)
+
+    codes = np.minimum(np.searchsorted(bundle.terms, terms), len(bundle.terms) - 1)
+    return np.where(bundle.terms[codes] == terms, bundle.namespaces[codes], -1).astype(np.int8)
+
+# flat (protein, term) table: protein index and term code of every annotation,
+# in the order of annotations, with terms holding the sorted distinct GO ids
+def encode_annotations(annotations):
+    prot_index = np.repeat(np.arange(len(annotations)), [len(gos) for prot, gos in annotations])
+    terms, term_index = np.unique(np.array([go for prot, gos in annotations for go in gos], dtype=str), return_inverse=True)
+
+    return prot_index, terms, term_index.reshape(-1)
+
+def group_annotations_by_namespace(annotations, onto=None):
+    prot_index, terms, term_index = encode_annotations(annotations)
+    term_namespaces = get_term_namespaces(terms, onto)[term_index]
+
+    valid = term_namespaces >= 0
+    keys = prot_index[valid] * len(NAMESPACES) + term_namespaces[valid]
+
+    order = np.argsort(keys, kind='stable')
+    counts = np.bincount(keys, minlength=len(annotations) * len(NAMESPACES))
+
+    return terms[term_index[valid][order]], counts.reshape(len(annotations), len(NAMESPACES))
+
+def classify_annotations_by_namespace(annotations, onto=None):
+    grouped_terms, counts = group_annotations_by_namespace(annotations, onto)
+    ns_gos = np.split(grouped_terms, np.cumsum(counts.reshape(-1))[:-1]) if len(annotations) > 0 else []
+
+    return [(prot,) + tuple(gos.tolist() for gos in ns_gos[i*len(NAMESPACES):(i+1)*len(NAMESPACES)])
+            for i, (prot, _) in enumerate(annotations)]
+
+def count_annotations_by_namespace(annotations, onto=None):
+    _, counts = group_annotations_by_namespace(annotations, onto)
 
-def count_annotations_by_namespace(annotations, onto):
-    for prot, bgos, cgos, mgos in classify_annotations_by_namespace(annotations, onto):
-        yield prot, len(bgos), len(cgos), len(mgos)
+    for (prot, _), prot_counts in zip(annotations, counts.tolist()):
+        yield (prot, *prot_counts)
 
-def compute_comparison_matrix(cmpobj, annotations, namespace=None):
-    comparison_mat = np.zeros((len(annotations), len(annotations)))
+
+# gos1 and gos2 are already restricted to namespace, so compare_for_namespace
+# is only left to handle proteins without annotations in it
+def compare_split_gos(cmpobj, namespace, gos1, gos2):
+    if gos1 and gos2:
+        return cmpobj.compare(gos1, gos2)
+    else:
+        return cmpobj.compare_for_namespace(namespace, gos1, gos2)
+
+def compute_comparison_matrix(cmpobj, annotations, namespace=None, out=None):
+    comparison_mat = np.zeros((len(annotations), len(annotations))) if out is None else out
 
     if namespace is None:
         compare = cmpobj.compare
     else:
-        compare = lambda gos1, gos2: cmpobj.compare_for_namespace(namespace, gos1, gos2)
+        compare = lambda gos1, gos2: compare_split_gos(cmpobj, namespace, gos1, gos2)
 
-    for i, (prot_id1, gos1) in enumerate(annotations):
-        if i % 10 == 0:
-            print(f'\rcomputing {namespace or ""} matrix entries ({i}/{len(annotations)} rows)... ', end='', file=sys.stderr)
+    n = len(annotations)
+    label = f'computing {namespace} matrix entries' if namespace else 'computing matrix entries'
+    progress = instrument.Progress(label, n * (n + 1) // 2, 'pairs')
 
+    for i, (prot_id1, gos1) in enumerate(annotations):
         for j, (prot_id2, gos2) in enumerate(annotations):
             if i <= j:
                 comparison_mat[i,j] = compare(gos1, gos2)
             else:
                 comparison_mat[i,j] = comparison_mat[j,i]
 
-    print(f'done', file=sys.stderr)
+        progress.update(n - i)
+
+    progress.close()
     return comparison_mat
 
 
-def compute_comparison_matrices(cmpobj, annotations):
-    comparison_mats = np.zeros((3, len(annotations), len(annotations)))
-    comparison_mats[0] = compute_comparison_matrix(cmpobj, annotations, 'biological_process')
-    comparison_mats[1] = compute_comparison_matrix(cmpobj, annotations, 'cellular_component')
-    comparison_mats[2] = compute_comparison_matrix(cmpobj, annotations, 'molecular_function')
+# state of each pool worker, set once by _init_comparison_worker or
+# _init_batch_worker
+_worker_cmpobj = None
+_worker_annotations = None
+_worker_comparer = None
+
+def _init_comparison_worker(measure, annotations):
+    global _worker_cmpobj, _worker_annotations
+
+    _worker_cmpobj = init_comparison_object(measure)
+    _worker_annotations = annotations
 
-    return comparison_mats
+def _compare_tile(tile):
+    (i0, i1), (j0, j1) = tile
+    tile_mats = np.zeros((len(NAMESPACES), i1 - i0, j1 - j0))
+
+    for k, namespace in enumerate(NAMESPACES):
+        for i in range(i0, i1):
+            gos1 = _worker_annotations[i][k+1]
+
+            for j in range(max(i, j0), j1):
+                gos2 = _worker_annotations[j][k+1]
+                tile_mats[k, i - i0, j - j0] = compare_split_gos(_worker_cmpobj, namespace, gos1, gos2)
+
+    return tile, tile_mats
+
+def _init_batch_worker(comparer):
+    global _worker_comparer
+
+    _worker_comparer = comparer
+
+def _compare_tile_batched(tile):
+    (i0, i1), (j0, j1) = tile
+    return tile, _worker_comparer.compare_tile(i0, i1, j0, j1)
+
+def _compare_term_tile(task):
+    namespace, (i0, i1), (j0, j1), terms1, terms2 = task
+    tile = np.zeros((i1 - i0, j1 - j0))
+
+    for i, go1 in enumerate(terms1, i0):
+        for j, go2 in enumerate(terms2, j0):
+            if i <= j:
+                tile[i - i0, j - j0] = _worker_cmpobj.compare_for_namespace(namespace, [go1], [go2])
+
+    return task[:3], tile
+
+def imap_in_workers(stack, fn, tasks, n_workers, initializer, initargs):
+    if n_workers == 1 or not tasks:
+        initializer(*initargs)
+        return map(fn, tasks)
+
+    pool = stack.enter_context(multiprocessing.Pool(n_workers, initializer, initargs))
+    return pool.imap(fn, tasks)
+
+def get_upper_triangle_tiles(n, tile_size):
+    bounds = [(start, min(start + tile_size, n)) for start in range(0, n, tile_size)]
+
+    return [(rows, cols) for k, rows in enumerate(bounds) for cols in bounds[k:]]
+
+# number of protein pairs of the upper triangle in a tile
+def count_tile_pairs(tile):
+    (i0, i1), (j0, j1) = tile
+
+    if i0 == j0:
+        return (i1 - i0) * (i1 - i0 + 1) // 2
+    else:
+        return (i1 - i0) * (j1 - j0)
+
+# without a path the matrix is kept in memory, where it defaults to the packed
+# layout: the upper triangle only, half the size of the dense one
+def make_comparison_store(annotations, dtype='float64', layout=None, path=None):
+    layout = layout or ('dense' if path is not None else 'packed')
+    prot_ids = [ann[0] for ann in annotations]
+    return semsim_storage.ComparisonMatrixStore(prot_ids, NAMESPACES, dtype=dtype, layout=layout, path=path)
+
+def get_row_bands(n, tile_size):
+    return [(start, min(start + tile_size, n)) for start in range(0, n, tile_size)]
+
+def load_done_bands(done_path):
+    if done_path is None or not path.exists(done_path):
+        return set()
+
+    with open(done_path) as done_f:
+        return {int(line) for line in done_f if not line.isspace()}
+
+def mark_band_done(done_path, band_start):
+    with open(done_path, 'a') as done_f:
+        print(band_start, file=done_f)
+        done_f.flush()
+        os.fsync(done_f.fileno())
+
+def iter_comparison_row_blocks(measure, split_annotations, store=None, n_workers=None, tile_size=256, done_path=None, comparer=None):
+    n = len(split_annotations)
+    store = store if store is not None else make_comparison_store(split_annotations)
+
+    done_bands = load_done_bands(done_path)
+    tiles = [tile for tile in get_upper_triangle_tiles(n, tile_size) if tile[0][0] not in done_bands]
+
+    if done_bands:
+        print(f'resuming: {len(done_bands)} row bands already computed', file=sys.stderr)
+
+    progress = instrument.Progress('computing matrix tiles', sum(map(count_tile_pairs, tiles)), 'pairs')
+
+    with contextlib.ExitStack() as stack:
+        if comparer is None:
+            tile_results = imap_in_workers(stack, _compare_tile, tiles, n_workers, _init_comparison_worker, (measure, split_annotations))
+        else:
+            tile_results = imap_in_workers(stack, _compare_tile_batched, tiles, n_workers, _init_batch_worker, (comparer,))
+
+        # tiles are returned in row-band order, so a band is complete (its
+        # lower part was mirrored from earlier bands) once its last column
+        # tile arrives
+        for i0, i1 in get_row_bands(n, tile_size):
+            if i0 not in done_bands:
+                for tile, tile_mats in tile_results:
+                    (_, _), (j0, j1) = tile
+                    store.set_tile(i0, i1, j0, j1, tile_mats)
+                    progress.update(count_tile_pairs(tile))
+
+                    if j1 == n:
+                        break
+
+                if done_path is not None:
+                    store.flush()
+                    mark_band_done(done_path, i0)
+
+            yield i0, store.row_block(i0, i1)
+
+    store.flush()
+    progress.close()
+
+# the tables are memory-mapped files in table_dir, which pool workers map
+# instead of each receiving a copy
+def compute_term_tables(measure, terms, table_dir, n_workers=None, tile_size=256):
+    term_tables = [np.memmap(path.join(table_dir, f'{namespace}.f8'), dtype=np.float64, mode='w+', shape=(len(ns_terms), len(ns_terms)))
+                   if ns_terms else np.zeros((0, 0))
+                   for namespace, ns_terms in zip(NAMESPACES, terms)]
+
+    tasks = [(namespace, rows, cols, ns_terms[rows[0]:rows[1]], ns_terms[cols[0]:cols[1]])
+             for namespace, ns_terms in zip(NAMESPACES, terms)
+             for rows, cols in get_upper_triangle_tiles(len(ns_terms), tile_size)]
+
+    with contextlib.ExitStack() as stack, \
+            instrument.Progress('computing term tables', sum(count_tile_pairs(task[1:3]) for task in tasks), 'pairs') as progress:
+        tile_results = imap_in_workers(stack, _compare_term_tile, tasks, n_workers, _init_comparison_worker, (measure, None))
+
+        for (namespace, (i0, i1), (j0, j1)), tile in tile_results:
+            if i0 == j0:
+                tile = np.triu(tile) + np.triu(tile, 1).T
+
+            table = term_tables[NAMESPACES.index(namespace)]
+            table[i0:i1, j0:j1] = tile
+            table[j0:j1, i0:i1] = tile.T
+
+            progress.update(count_tile_pairs(((i0, i1), (j0, j1))))
+
+    for table in term_tables:
+        if isinstance(table, np.memmap):
+            table.flush()
+
+    return term_tables
+
+MEASURE_BEST_MATCH = {'hrss': np.maximum, 'mica-dissim': np.minimum}
+
+# the term tables go to a temporary directory under the cache dir, which is
+# removed together with the comparer
+def build_batch_comparer(measure, split_annotations, n_workers=None, tile_size=256):
+    terms, prot_terms = semsim_batch.encode_prot_terms(split_annotations, len(NAMESPACES))
+
+    cache_dir = go_closure.get_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    table_dir = tempfile.TemporaryDirectory(prefix='semsim_term_tables_', dir=cache_dir)
+
+    term_tables = compute_term_tables(measure, terms, table_dir.name, n_workers, tile_size)
+
+    return semsim_batch.BatchComparer(MEASURE_BEST_MATCH[measure], term_tables, prot_terms, table_dir)
+
+# protein index pairs to check, i <= j. Every tenth pair compares a protein
+# with itself, since best-match averaging of identical sets is a case of its own
+def sample_check_pairs(n, n_samples):
+    pairs = []
+
+    for k in range(n_samples if n > 0 else 0):
+        if k % 10 == 0 or n == 1:
+            i = random.randrange(n)
+            pairs.append((i, i))
+        else:
+            pairs.append(tuple(sorted(random.sample(range(n), 2))))
+
+    return pairs
+
+def check_batch_comparer(cmpobj, comparer, annotations, n_samples=100):
+    mismatches = []
+
+    for i, j in sample_check_pairs(len(annotations), n_samples):
+        scores = comparer.compare_tile(i, i+1, j, j+1)[:, 0, 0]
+
+        for k, namespace in enumerate(NAMESPACES):
+            expected = cmpobj.compare_for_namespace(namespace, annotations[i][1], annotations[j][1])
+
+            if not math.isclose(scores[k], expected, rel_tol=1e-9, abs_tol=1e-12):
+                mismatches.append((annotations[i][0], annotations[j][0], namespace, scores[k], expected))
+
+    return mismatches
+
+# ic_version is the digest of the curated frequencies file, so that bands
+# computed with different IC values are never mixed
+def get_checkpoint_key(measure, species_id, evidence_codes, go_version, ic_version, annotations, tile_size, dtype, layout):
+    digest = hashlib.sha1()
+    digest.update(repr((measure, species_id, sorted(evidence_codes), go_version, ic_version, tile_size, dtype, layout)).encode())
+
+    for prot, gos in annotations:
+        digest.update(f'{prot}\t{" ".join(sorted(gos))}\n'.encode())
+
+    return digest.hexdigest()[:16]
+
+def open_checkpoint(checkpoint_dir, annotations, dtype, layout):
+    matrix_path = path.join(checkpoint_dir, 'matrix')
+    done_path = path.join(checkpoint_dir, 'bands_done')
+
+    if path.exists(done_path):
+        store = semsim_storage.ComparisonMatrixStore.open(matrix_path, mode='r+')
+    else:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        store = make_comparison_store(annotations, dtype=dtype, layout=layout, path=matrix_path)
+        open(done_path, 'w').close()
+
+    return store, done_path
+
+
+def iter_matrix_row_blocks(comparison_mats, block_size=1024):
+    for start in range(0, comparison_mats.shape[1], block_size):
+        yield start, comparison_mats[:, start:start+block_size]
+
+# a cell passes the threshold when the score of any namespace is at least the
+# threshold for similarities, or at most the threshold for dissimilarities
+THRESHOLD_COMPARISONS = {'hrss': np.greater_equal, 'mica-dissim': np.less_equal}
+
+def iter_comparison_entries(row_blocks, upper=False, threshold=None, measure=None):
+    if threshold is not None and measure not in THRESHOLD_COMPARISONS:
+        raise ValueError(f'a threshold needs a known measure, got: {measure}')
+
+    for start, block in row_blocks:
+        mask = np.any(block != 0, axis=0)
+
+        if threshold is not None:
+            mask &= np.any(THRESHOLD_COMPARISONS[measure](block, threshold), axis=0)
+
+        if upper:
+            mask &= np.arange(block.shape[2]) >= np.arange(start, start + block.shape[1])[:, np.newaxis]
+
+        rows, cols = np.nonzero(mask)
+        yield rows + start, cols, block[:, rows, cols].T
+
+
+COMPARISON_COLUMNS = ('protein1', 'protein2') + NAMESPACES
+
+def _comparison_entries_frame(prot_ids, rows, cols, values):
+    columns = {'protein1': prot_ids[rows], 'protein2': prot_ids[cols]}
+    columns.update((namespace, values[:, k]) for k, namespace in enumerate(NAMESPACES))
+
+    return pd.DataFrame(columns, columns=COMPARISON_COLUMNS)
+
+def write_comparison_entries_tsv(prot_ids, entries, out_f):
+    out_f.write('\t'.join(COMPARISON_COLUMNS) + '\n')
+
+    for rows, cols, values in entries:
+        _comparison_entries_frame(prot_ids, rows, cols, values).to_csv(out_f, sep='\t', header=False, index=False)
+
+def _write_npz_member(npz_f, name, dtype, shape, data_f):
+    header = {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': shape}
+
+    with npz_f.open(f'{name}.npy', 'w', force_zip64=True) as member_f:
+        np.lib.format.write_array_header_2_0(member_f, header)
+
+        data_f.seek(0)
+        shutil.copyfileobj(data_f, member_f, 1 << 20)
+
+# same layout as np.savez_compressed, but the entries are spooled block by
+# block to temporary files and copied into the archive, so only one block is
+# held in memory
+def write_comparison_entries_npz(prot_ids, entries, out_path, upper=False):
+    import zipfile
+
+    with tempfile.TemporaryFile() as rows_f, tempfile.TemporaryFile() as cols_f, tempfile.TemporaryFile() as data_f:
+        n_entries = 0
+
+        for rows, cols, values in entries:
+            rows_f.write(rows.astype(np.int64).tobytes())
+            cols_f.write(cols.astype(np.int64).tobytes())
+            data_f.write(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+
+            n_entries += len(rows)
+
+        with zipfile.ZipFile(out_path, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as npz_f:
+            for name, array in (('protein_ids', prot_ids), ('namespaces', np.array(NAMESPACES)), ('upper', np.array(upper))):
+                with npz_f.open(f'{name}.npy', 'w', force_zip64=True) as member_f:
+                    np.lib.format.write_array(member_f, array, allow_pickle=True)
+
+            _write_npz_member(npz_f, 'row', np.int64, (n_entries,), rows_f)
+            _write_npz_member(npz_f, 'col', np.int64, (n_entries,), cols_f)
+            _write_npz_member(npz_f, 'data', np.float64, (n_entries, len(NAMESPACES)), data_f)
+
+def write_comparison_entries_parquet(prot_ids, entries, out_path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    empty = _comparison_entries_frame(prot_ids, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty((0, len(NAMESPACES))))
+    schema = pa.Schema.from_pandas(empty, preserve_index=False)
+
+    with pq.ParquetWriter(out_path, schema) as writer:
+        for rows, cols, values in entries:
+            frame = _comparison_entries_frame(prot_ids, rows, cols, values)
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+
+def get_output_format(output_path):
+    if output_path.endswith('.npz'):
+        return 'npz'
+    elif output_path.endswith('.parquet'):
+        return 'parquet'
+    else:
+        return 'tsv'
+
+def write_comparison_blocks(annotations, row_blocks, output_path, fmt=None, upper=False, threshold=None, measure=None):
+    prot_ids = np.array([ann[0] for ann in annotations])
+    entries = iter_comparison_entries(row_blocks, upper, threshold, measure)
+
+    fmt = fmt or get_output_format(output_path)
+
+    if fmt == 'tsv':
+        write_comparison_entries_tsv(prot_ids, entries, open_arg_file(output_path, 'w+'))
+    elif fmt == 'npz':
+        write_comparison_entries_npz(prot_ids, entries, output_path, upper)
+    elif fmt == 'parquet':
+        write_comparison_entries_parquet(prot_ids, entries, output_path)
+    else:
+        raise ValueError(f'unknown output format: {fmt}')
 
 
 def write_annotation_comparison_matrix(annotations, comparison_mat, out_f):
@@ -174,75 +890,153 @@ def write_annotation_comparison_matrix(annotations, comparison_mat, out_f):
                 writer.writerow((annotations[i][0], annotations[j][0], comparison_mat[i,j]))
 
 def write_annotation_comparison_matrices(annotations, comparison_mat, out_f):
-    writer = csv.writer(out_f, delimiter='\t')
-    writer.writerow(('protein1', 'protein2', 'biological_process', 'cellular_component', 'molecular_function'))
-
-    for i in range(len(annotations)):
-        for j in range(len(annotations)):
-            if np.any(comparison_mat[:,i,j] != 0):
-                writer.writerow((annotations[i][0], annotations[j][0],
-                    comparison_mat[0,i,j], comparison_mat[1,i,j], comparison_mat[2,i,j]))
+    prot_ids = np.array([prot for prot, gos in annotations])
+    write_comparison_entries_tsv(prot_ids, iter_comparison_entries(iter_matrix_row_blocks(comparison_mat)), out_f)
 
 
 if __name__ == '__main__':
-    cmd = sys.argv[1]
+    args, options = parse_options(sys.argv)
+    cmd = args[1]
 
-    go_onto = godb.load_go_obo()
-    go_is_a_g = godb.onto_rel_graph(go_onto)
-    evidence_codes = godb.get_curated_evidence_codes()
+    instrument.track_run(cmd, args=args[2:], options=options)
 
-    assert len(list(nx.weakly_connected_components(go_is_a_g))) == 3
+    evidence_codes = godb.get_curated_evidence_codes()
+    cache = stringdb_cache.get_docker_cache() if 'cache' in options else None
 
     if cmd == 'alternatives':
-        go_list_path = sys.argv[2]
-        output_path = sys.argv[3]
-
-        go_list = load_go_list(open_arg_file(go_list_path, 'r'))
-        alternatives = find_valid_go_alternatives(go_list, go_onto, go_is_a_g, evidence_codes)
+        go_list_path = args[2]
+        output_path = args[3]
 
-        writer = csv.writer(open_arg_file(output_path, 'w+'), delimiter='\t')
-        writer.writerows(alternatives)
+        table = get_alternatives_table(load_ontology_graphs)
+        map_go_alternatives(open_arg_file(go_list_path, 'r'), open_arg_file(output_path, 'w+'), table)
 
     elif cmd == 'curated-frequencies':
-        source = sys.argv[2]
-        output_path = sys.argv[3]
+        source = args[2]
+        output_path = args[3]
 
-        freqs = get_curated_frequencies(source, go_is_a_g, evidence_codes)
+        is_a = load_is_a_edges()
+
+        if options.get('engine', 'set-based' if source == 'stringdb' else 'per-term') == 'set-based':
+            freqs = list(get_curated_frequencies_set_based(source, is_a, evidence_codes))
+        else:
+            freqs = list(get_curated_frequencies(source, is_a, evidence_codes))
 
         writer = csv.writer(open_arg_file(output_path, 'w+'), delimiter='\t')
         writer.writerows(freqs)
 
+        if 'check' in options:
+            n_samples = int(options['check']) if options['check'] else None
+            mismatches = check_curated_frequencies(source, is_a, evidence_codes, dict(freqs), n_samples)
+
+            for go, go_cnt, expected_cnt in mismatches:
+                print(f'mismatch {go}: {go_cnt} != {expected_cnt}', file=sys.stderr)
+
+            if mismatches:
+                sys.exit(1)
+
+    elif cmd == 'update-ontology':
+        old_obo_path = args[2]
+        engine = options.get('engine', 'set-based')
+
+        # without a bundle, both uses share one parse of the new OBO
+        load_new_graphs = functools.lru_cache(maxsize=None)(load_ontology_graphs)
+
+        new_table = get_alternatives_table(load_new_graphs)
+        _, new_is_a_g, _ = load_new_graphs()
+
+        old_onto, old_is_a_g, old_alt_id_g = load_obo_graphs(old_obo_path)
+        old_table = build_alternatives_table(old_onto, old_is_a_g, old_alt_id_g)
+
+        remapping = diff_alternatives_tables(old_table, new_table)
+        affected = get_affected_terms(old_is_a_g, new_is_a_g, old_table, remapping)
+
+        print(f' > {len(remapping)} remapped go ids, {sum(alt_id is None for alt_id in remapping.values())} without a valid alternative', file=sys.stderr)
+        print(f' > {len(affected)} of {nx.number_of_nodes(new_is_a_g)} terms with affected frequencies', file=sys.stderr)
+
+        if 'dry-run' not in options:
+            with stringdb.get_docker_session().cursor() as string_cursor:
+                n_updated, n_deleted = stringdb.remap_gene_ontology_terms(string_cursor, remapping)
+
+            print(f' > remapped {n_updated} and removed {n_deleted} rows of mapping.gene_ontology', file=sys.stderr)
+
+            freqs_path = get_curated_frequencies_path()
+            freqs = update_curated_frequencies('stringdb', new_is_a_g, evidence_codes, load_curated_frequencies(freqs_path), affected, engine)
+
+            with open(freqs_path + '.tmp', 'w') as freqs_f:
+                csv.writer(freqs_f, delimiter='\t').writerows(freqs)
+
+            os.replace(freqs_path + '.tmp', freqs_path)
+
     elif cmd == 'namespace-ann-counts':
-        source = sys.argv[2]
-        species_id = int(sys.argv[3])
-        output_path = sys.argv[4]
+        source = args[2]
+        species_id = int(args[3])
+        output_path = args[4]
 
-        annotations = get_all_annotations_for_species(source, species_id, evidence_codes)
-        annotations = count_annotations_by_namespace(annotations, go_onto)
+        annotations = get_all_annotations_for_species(source, species_id, evidence_codes, cache)
+        annotations = count_annotations_by_namespace(annotations)
 
         writer = csv.writer(open_arg_file(output_path, 'w+'), delimiter='\t')
         writer.writerow(('protein', 'biological_process', 'cellular_component', 'molecular_function'))
         writer.writerows(annotations)
 
     elif cmd == 'semsim-matrix':
-        measure = sys.argv[2]
-        source = sys.argv[3]
-        species_id = int(sys.argv[4])
-        output_path = sys.argv[5]
+        measure = args[2]
+        source = args[3]
+        species_id = int(args[4])
+        output_path = args[5]
+
+        n_workers = int(options.get('workers', 1))
+        tile_size = int(options.get('tile-size', 256))
+        threshold = float(options['threshold']) if 'threshold' in options else None
+
+        annotations = get_all_annotations_for_species(source, species_id, evidence_codes, cache)
+        with instrument.phase('namespace_split', n_prots=len(annotations)):
+            split_annotations = classify_annotations_by_namespace(annotations)
+
+        dtype = options.get('dtype', 'float64')
+        layout = options.get('layout', 'dense' if 'store' in options or 'checkpoint' in options else 'packed')
+
+        if 'checkpoint' in options:
+            go_version = load_is_a_edges().get_version()
+            ic_version = go_bundle.get_files_digest(get_curated_frequencies_path())
+            checkpoint_key = get_checkpoint_key(measure, species_id, evidence_codes, go_version, ic_version, annotations, tile_size, dtype, layout)
+            store, done_path = open_checkpoint(path.join(options['checkpoint'], checkpoint_key), annotations, dtype, layout)
+        else:
+            store = make_comparison_store(annotations, dtype=dtype, layout=layout, path=options.get('store'))
+            done_path = None
+
+        if options.get('engine') == 'batched':
+            with instrument.phase('term_tables', measure=measure, n_workers=n_workers):
+                comparer = build_batch_comparer(measure, split_annotations, n_workers, tile_size)
 
-        annotations = get_all_annotations_for_species(source, species_id, evidence_codes)
+            if 'check' in options:
+                mismatches = check_batch_comparer(init_comparison_object(measure), comparer, annotations, int(options['check'] or 100))
 
-        if measure == 'mica-dissim':
-            cmpobj = init_default_mica_dissim()
-        elif measure == 'hrss':
-            cmpobj = init_default_hrss()
+                for prot1, prot2, namespace, score, expected in mismatches:
+                    print(f'mismatch {prot1} {prot2} {namespace}: {score} != {expected}', file=sys.stderr)
+
+                if mismatches:
+                    sys.exit(1)
         else:
-            raise ValueError(f'unknown (dis)similarity measure: {measure}')
+            comparer = None
+
+        row_blocks = iter_comparison_row_blocks(measure, split_annotations, store, n_workers, tile_size, done_path, comparer)
+
+        write_comparison_blocks(annotations, row_blocks, output_path,
+            fmt=options.get('format'), upper='upper' in options, threshold=threshold, measure=measure)
+
+    elif cmd == 'semsim-export':
+        store_path = args[2]
+        output_path = args[3]
+
+        threshold = float(options['threshold']) if 'threshold' in options else None
 
-        mats = compute_comparison_matrices(cmpobj, annotations)
+        store = semsim_storage.ComparisonMatrixStore.open(store_path)
+        annotations = [(prot, None) for prot in store.protein_ids]
 
-        print('writing results...', file=sys.stderr)
-        write_annotation_comparison_matrices(annotations, mats, open_arg_file(output_path, 'w+'))
+        write_comparison_blocks(annotations, store.iter_row_blocks(), output_path,
+            fmt=options.get('format'), upper='upper' in options, threshold=threshold, measure=options.get('measure'))
 
     else:
         print('unknown command:', cmd, file=sys.stderr)
+        print(USAGE, file=sys.stderr)
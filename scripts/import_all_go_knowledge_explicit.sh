@@ -1,9 +1,10 @@
 #!/bin/bash
 
-set -e
+set -e -o pipefail
 
 script_dir="$(dirname "$0")"
 stringdb_dir="$script_dir/.."
+maintenance_workers="${STRINGDB_MAINTENANCE_WORKERS:-2}"
 
 # source "$script_dir/python3.6.5.venv/bin/activate"
 
@@ -24,7 +25,7 @@ docker-compose exec -T stringdb \
             confidence_score smallint not null
         );"
 
-wget "https://version-10-5.string-db.org/mapping_files/gene_ontology_mappings/all_go_knowledge_explicit.tsv.gz" -O- --tries=0 | \
+python "$script_dir/download_cache.py" cat "https://version-10-5.string-db.org/mapping_files/gene_ontology_mappings/all_go_knowledge_explicit.tsv.gz" | \
     gzip -d |                                                                                                      \
     docker-compose exec -T stringdb                                                                                \
         psql -1 stringdb stringdb -c                                                                               \
@@ -94,6 +95,8 @@ echo "Creating indices"
 
 docker-compose exec -T stringdb \
     psql -1 stringdb stringdb -c "
+        set max_parallel_maintenance_workers = $maintenance_workers;
+
         create index
           si_gene_ontology_string_id
         on
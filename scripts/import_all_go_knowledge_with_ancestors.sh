@@ -1,6 +1,8 @@
 #!/bin/bash
 
-set -e
+set -e -o pipefail
+
+script_dir="$(dirname "$0")"
 
 docker-compose exec -T stringdb \
     psql -1 stringdb stringdb -c "
@@ -17,7 +19,7 @@ docker-compose exec -T stringdb \
             confidence_score smallint not null
         );"
 
-wget "https://version-10-5.string-db.org/mapping_files/gene_ontology_mappings/all_go_knowledge_full.tsv.gz" -O- --tries=0 | \
+python "$script_dir/download_cache.py" cat "https://version-10-5.string-db.org/mapping_files/gene_ontology_mappings/all_go_knowledge_full.tsv.gz" | \
     gzip -d |                                                                                                      \
     docker-compose exec -T stringdb                                                                                \
         psql -1 stringdb stringdb -c                                                                               \
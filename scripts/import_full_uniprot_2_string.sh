@@ -1,6 +1,9 @@
 #!/bin/bash
 
-set -e
+set -e -o pipefail
+
+script_dir="$(dirname "$0")"
+maintenance_workers="${STRINGDB_MAINTENANCE_WORKERS:-2}"
 
 docker-compose exec -T stringdb \
     psql -1 stringdb stringdb -c "
@@ -15,7 +18,7 @@ docker-compose exec -T stringdb \
             bit_score   real     not null
         );"
 
-wget 'https://version-10-5.string-db.org/mapping_files/uniprot_mappings/full_uniprot_2_string.04_2015.tsv.gz' -O- --tries=0 | \
+python "$script_dir/download_cache.py" cat 'https://version-10-5.string-db.org/mapping_files/uniprot_mappings/full_uniprot_2_string.04_2015.tsv.gz' | \
     gzip -d |                                                                             \
     tail -n +2 |                                                                          \
     sed -e 's/|/\t/' |                                                                    \
@@ -48,6 +51,8 @@ docker-compose exec -T stringdb \
 
         drop table mapping.tmp_uniprot;
 
+        set max_parallel_maintenance_workers = $maintenance_workers;
+
         create index
           si_uniprot_string_id
         on
@@ -1,5 +1,10 @@
 #!/bin/zsh
 
+setopt pipefail
+
+# index builds of the dumps run in the same psql session
+maintenance_workers="${STRINGDB_MAINTENANCE_WORKERS:-2}"
+
 die() {
     echo "$@"
     exit 1
@@ -10,6 +15,19 @@ do
     if [ "$dump_name" = - ]
     then
         dump_path=/dev/stdin
+    elif [[ "$dump_name" = http://* || "$dump_name" = https://* ]]
+    then
+        # downloads go through the local cache, so a failed import can be
+        # retried from the cached dump
+        script_dir="$(dirname "$(readlink -f "$0")")"
+        echo "importing..."
+
+        { echo "set max_parallel_maintenance_workers = $maintenance_workers;"
+          python "$script_dir/download_cache.py" cat "$dump_name" | gzip -d; } | \
+            docker-compose exec -T stringdb                        \
+                psql -1 stringdb stringdb || die "error: import of $dump_name failed"
+
+        continue
     else
         script_dir="$(dirname "$(readlink -f "$0")")"
         dump_path="$script_dir/../$dump_name"
@@ -18,6 +36,8 @@ do
 
     echo "importing..."
 
-    docker-compose exec -T stringdb \
-        psql -1 stringdb stringdb < "$dump_path"
+    { echo "set max_parallel_maintenance_workers = $maintenance_workers;"
+      cat "$dump_path"; } |             \
+        docker-compose exec -T stringdb \
+            psql -1 stringdb stringdb
 done
@@ -0,0 +1,84 @@
+#!/bin/bash
+
+set -e
+
+# the container is looked up by its compose labels, so that this also reaches
+# databases of other compose projects, e.g. the virus database:
+#
+#   import_stringdb_evidence_scores.sh stringdb-virus stringdb-virus stringdb_virus helen
+project="${1:-stringdb}"
+service="${2:-stringdb}"
+dbname="${3:-stringdb}"
+user="${4:-stringdb}"
+maintenance_workers="${STRINGDB_MAINTENANCE_WORKERS:-2}"
+
+container="$(docker ps -q \
+    --filter "label=com.docker.compose.project=$project" \
+    --filter "label=com.docker.compose.service=$service")"
+
+if [ -z "$container" ]
+then
+    echo "error: no running $service container in compose project $project"
+    exit 1
+fi
+
+echo "Creating network.evidence_scores from network.node_node_links"
+
+docker exec -i "$container" \
+    psql -1 "$dbname" "$user" -c "
+        create table network.evidence_scores as
+          select
+            node_type_a,
+            node_type_b,
+            node_id_a,
+            node_id_b,
+            evidence_scores[i][1] score_type,
+            evidence_scores[i][2] score
+          from (
+            select
+              node_type_a,
+              node_type_b,
+              node_id_a,
+              node_id_b,
+              evidence_scores,
+              generate_subscripts(evidence_scores, 1) as i
+            from
+              network.node_node_links
+          ) as indexed_scores
+          order by
+            node_type_b, score_type, score;"
+
+echo "Creating indices"
+
+docker exec -i "$container" \
+    psql -1 "$dbname" "$user" -c "
+        set max_parallel_maintenance_workers = $maintenance_workers;
+
+        create index
+          si_evidence_scores_node_type_b_score_type_score
+        on
+          network.evidence_scores
+        using
+          btree (node_type_b, score_type, score)
+        with
+          (fillfactor = 100);
+
+        create index
+          si_evidence_scores_node_type_a_score_type
+        on
+          network.evidence_scores
+        using
+          btree (node_type_a, score_type)
+        with
+          (fillfactor = 100);
+
+        create index
+          si_evidence_scores_node_type_b
+        on
+          network.evidence_scores
+        using
+          brin (node_type_b)
+        with
+          (pages_per_range = 128);
+
+        analyze network.evidence_scores;"
@@ -2,11 +2,10 @@
 
 
 script_dir="$(dirname "$0")"
+maintenance_workers="${STRINGDB_MAINTENANCE_WORKERS:-2}"
 
 until
-    wget https://version-10-5.string-db.org/download/homology_schema.v10.5.sql.gz -O- --tries=0 |
-        gzip -d |
-        "$script_dir/import_stringdb.sh" -
+    "$script_dir/import_stringdb.sh" https://version-10-5.string-db.org/download/homology_schema.v10.5.sql.gz
 do
     echo "initial homology import failed, retrying"
 done
@@ -54,6 +53,8 @@ echo "creating indices for homology.blast_data"
 
 docker-compose exec -T stringdb \
     psql stringdb stringdb -c "
+    set max_parallel_maintenance_workers = $maintenance_workers;
+
     create index si_blast_data_species
     on
       homology.blast_data
@@ -1,13 +1,14 @@
 #!/bin/bash
 
 script_dir="$(dirname "$0")"
+maintenance_workers="${STRINGDB_MAINTENANCE_WORKERS:-2}"
 
-wget https://version-10-5.string-db.org/download/network_schema.v10.5.sql.gz -O- --tries=0 | \
-    gzip -d |                                                                         \
-    "$script_dir/import_stringdb.sh" - &&                                             \
+"$script_dir/import_stringdb.sh" https://version-10-5.string-db.org/download/network_schema.v10.5.sql.gz && \
                                                                                       \
     docker-compose exec -T stringdb                                                   \
         psql -1 stringdb stringdb -c "
+        set max_parallel_maintenance_workers = $maintenance_workers;
+
         create index
           si_node_node_links_node_type_b
         on
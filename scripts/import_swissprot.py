@@ -1,11 +1,15 @@
 from xml.etree import ElementTree
-from urllib.request import urlopen
 from gzip import GzipFile
+import io
+import download_cache
+import instrument
+import itertools
 import stringdb
 import sys
 import pdb
 
 
+SWISSPROT_URL = 'https://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/complete/uniprot_sprot.xml.gz'
 
 
 def create_column(cursor):
@@ -14,36 +18,78 @@ def create_column(cursor):
         add column swiss_prot boolean default false;
         """);
 
-def parse_xml(cursor, f):
+def create_accessions_table(cursor):
+    cursor.execute("""
+        create temporary table swissprot_accessions (
+            uniprot_ac text not null
+        );
+        """)
+
+def iter_accessions(f):
     xml = iter(ElementTree.iterparse(f, events=('start', 'end')))
     _, root = next(xml)
 
     for event, elem in xml:
-        if event != 'end' and elem.tag == '{http://uniprot.org/uniprot}entry':
+        if event == 'end' and elem.tag == '{http://uniprot.org/uniprot}entry':
             uniprot_ac = elem.find('{http://uniprot.org/uniprot}accession')
 
             if uniprot_ac is not None:
-                print(f'set {uniprot_ac.text}')
-
-                cursor.execute("""
-                    update mapping.uniprot set swiss_prot = true where uniprot_ac = %(uniprot_ac)s;
-                    """,
-                    {'uniprot_ac': uniprot_ac.text})
+                yield uniprot_ac.text
 
             elem.clear()
             root.clear()
 
+def copy_accessions(cursor, accessions, batch_size=100000):
+    with instrument.Progress('copying accessions', unit='accessions') as progress:
+        while True:
+            batch = list(itertools.islice(accessions, batch_size))
+            if not batch:
+                break
+
+            cursor.copy_from(io.StringIO('\n'.join(batch) + '\n'), 'swissprot_accessions', columns=('uniprot_ac',))
+            progress.update(len(batch))
+
+    return progress.done
+
+def flag_swissprot(cursor):
+    cursor.execute("""
+        analyze swissprot_accessions;
+
+        update mapping.uniprot uni
+        set
+          swiss_prot = true
+        from (
+          select distinct
+            uniprot_ac
+          from
+            swissprot_accessions
+        ) acs
+        where
+          uni.uniprot_ac = acs.uniprot_ac;
+        """)
+
+    return cursor.rowcount
+
+def parse_xml(cursor, f):
+    create_accessions_table(cursor)
+    copy_accessions(cursor, iter_accessions(f))
+
+    print('flagging swiss-prot entries... ', end='', file=sys.stderr)
+    n_flagged = flag_swissprot(cursor)
+    print(f'{n_flagged} rows updated', file=sys.stderr)
+
 if __name__ == '__main__':
-    with stringdb.connect_to_docker() as conn:
+    with stringdb.get_docker_session().connection() as conn:
         with conn.cursor() as cursor:
             print('connected')
 
             create_column(cursor)
 
             if len(sys.argv) == 1:
-                with urlopen('ftp://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/complete/uniprot_sprot.xml.gz') as ftp_conn:
-                    with GzipFile(fileobj=ftp_conn) as decompressed_f:
-                        parse_xml(cursor, decompressed_f)
+                sprot_path = download_cache.download(SWISSPROT_URL)
+
+                with GzipFile(sprot_path) as decompressed_f:
+                    parse_xml(cursor, decompressed_f)
 
             elif sys.argv[1] == '-':
                 parse_xml(cursor, sys.stdin)
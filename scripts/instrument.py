@@ -0,0 +1,246 @@
+import atexit
+import contextlib
+import json
+import os
+import resource
+import sys
+import time
+
+
+# metrics are appended as JSON lines to the file named by STRINGDB_METRICS ('-'
+# for stderr), one line per query, phase, progress loop and run. Without it
+# nothing is recorded: phases only check the variable, and sessions keep the
+# plain psycopg2 cursors.
+_metrics_f = None
+
+def get_metrics_path():
+    return os.environ.get('STRINGDB_METRICS')
+
+def enabled():
+    return get_metrics_path() is not None
+
+def _get_metrics_file():
+    global _metrics_f
+
+    if _metrics_f is None:
+        metrics_path = get_metrics_path()
+        _metrics_f = sys.stderr if metrics_path == '-' else open(metrics_path, 'a', buffering=1)
+
+    return _metrics_f
+
+def emit(event, **fields):
+    if not enabled():
+        return
+
+    record = {'event': event, 'time': time.time(), 'pid': os.getpid()}
+    record.update(fields)
+
+    _get_metrics_file().write(json.dumps(record, default=str) + '\n')
+
+
+def get_max_rss():
+    # ru_maxrss is in kilobytes on linux
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+
+    return self_rss, children_rss
+
+class _Timer:
+    def __init__(self):
+        self.wall = time.perf_counter()
+        self.times = os.times()
+
+    def elapsed(self):
+        times = os.times()
+        self_rss, children_rss = get_max_rss()
+
+        return {
+            'wall_seconds': time.perf_counter() - self.wall,
+            'cpu_seconds': (times.user + times.system) - (self.times.user + self.times.system),
+            'children_cpu_seconds': (times.children_user + times.children_system) - (self.times.children_user + self.times.children_system),
+            'max_rss_bytes': self_rss,
+            'children_max_rss_bytes': children_rss}
+
+@contextlib.contextmanager
+def phase(name, **fields):
+    if not enabled():
+        yield
+        return
+
+    timer = _Timer()
+
+    try:
+        yield
+    finally:
+        emit('phase', name=name, **timer.elapsed(), **fields)
+
+# emits a 'run' record with the totals of the process when it exits
+def track_run(name, **fields):
+    if not enabled():
+        return
+
+    timer = _Timer()
+    atexit.register(lambda: emit('run', name=name, **timer.elapsed(), **fields))
+
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return f'{hours}:{minutes:02d}:{seconds:02d}' if hours else f'{minutes}:{seconds:02d}'
+
+# progress line on stderr with rate and ETA, redrawn at most every interval
+# seconds; the totals are emitted as a 'progress' record when it is closed
+class Progress:
+    def __init__(self, label, total=None, unit='items', interval=0.5):
+        self.label = label
+        self.total = total
+        self.unit = unit
+        self.interval = interval
+
+        self.done = 0
+        self.start = time.perf_counter()
+        self.last_print = None
+
+    def update(self, n=1):
+        self.done += n
+        now = time.perf_counter()
+
+        if self.last_print is None or now - self.last_print >= self.interval:
+            self.last_print = now
+            self.print_line(now)
+
+    def print_line(self, now):
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+
+        if self.total is None:
+            status = f'{self.done} {self.unit}, {rate:.1f}/s'
+        else:
+            status = f'{self.done}/{self.total} {self.unit}, {rate:.1f}/s'
+
+            if 0 < rate and self.done < self.total:
+                status += f', eta {format_seconds((self.total - self.done) / rate)}'
+
+        print(f'\r{self.label} ({status})... ', end='', file=sys.stderr)
+
+    def close(self):
+        now = time.perf_counter()
+        elapsed = now - self.start
+
+        self.print_line(now)
+        print('done', file=sys.stderr)
+
+        emit('progress', name=self.label, unit=self.unit, done=self.done, total=self.total,
+             wall_seconds=elapsed, rate=self.done / elapsed if elapsed > 0 else None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_cursor_factory = None
+
+# function outside of this module that called into the cursor
+def _get_caller_name():
+    frame = sys._getframe(1)
+
+    while frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+
+    return frame.f_code.co_name
+
+# psycopg2 cursor class that records, for every statement, the function that
+# issued it, the time spent in execute/copy and in fetching, the time until the
+# next statement or close, and the number of rows read (or affected). Fetches
+# are timed per batch: iterating over the cursor reads itersize rows at a time
+# through fetchmany, as named cursors do anyway, so rows are not timed one by
+# one.
+def get_cursor_factory():
+    global _cursor_factory
+
+    if _cursor_factory is not None:
+        return _cursor_factory
+
+    import psycopg2.extensions
+
+    class TimedCursor(psycopg2.extensions.cursor):
+        _query = None
+
+        def _start_query(self, kind):
+            self._finish_query()
+            self._query = {
+                'query': _get_caller_name(),
+                'kind': kind,
+                'cursor': self.name,
+                'execute_seconds': 0.0,
+                'fetch_seconds': 0.0,
+                'rows': 0,
+                'start': time.perf_counter()}
+
+        def _finish_query(self):
+            if self._query is not None:
+                query, self._query = self._query, None
+
+                query['open_seconds'] = time.perf_counter() - query.pop('start')
+
+                emit('query', **query)
+
+        def _timed(self, kind, method, *args, **kwargs):
+            self._start_query(kind)
+            start = time.perf_counter()
+
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._query['execute_seconds'] += time.perf_counter() - start
+                self._query['rowcount'] = self.rowcount
+
+        def _add_fetch(self, start, rows):
+            if self._query is not None:
+                self._query['fetch_seconds'] += time.perf_counter() - start
+                self._query['rows'] += rows
+
+        def execute(self, query, vars=None):
+            return self._timed('execute', super().execute, query, vars)
+
+        def copy_from(self, *args, **kwargs):
+            return self._timed('copy', super().copy_from, *args, **kwargs)
+
+        def copy_expert(self, *args, **kwargs):
+            return self._timed('copy', super().copy_expert, *args, **kwargs)
+
+        def fetchone(self):
+            start = time.perf_counter()
+            row = super().fetchone()
+            self._add_fetch(start, row is not None)
+            return row
+
+        def fetchmany(self, size=None):
+            start = time.perf_counter()
+            rows = super().fetchmany(self.arraysize if size is None else size)
+            self._add_fetch(start, len(rows))
+            return rows
+
+        def fetchall(self):
+            start = time.perf_counter()
+            rows = super().fetchall()
+            self._add_fetch(start, len(rows))
+            return rows
+
+        def __iter__(self):
+            while True:
+                rows = self.fetchmany(self.itersize)
+                if not rows:
+                    return
+
+                yield from rows
+
+        def close(self):
+            self._finish_query()
+            super().close()
+
+    _cursor_factory = TimedCursor
+    return _cursor_factory
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+from os import path
+import concurrent.futures
+import os
+import subprocess
+import sys
+import time
+
+import cli
+
+
+script_dir = path.dirname(path.realpath(__file__))
+
+
+# stage name -> (command, stages it depends on). Every stage streams its
+# download through gzip into psql, so downloading and loading already overlap
+# within a stage; independent stages run concurrently. Index builds stay inside
+# each stage, after its data is loaded; the psql sessions that build them set
+# max_parallel_maintenance_workers from STRINGDB_MAINTENANCE_WORKERS.
+STAGES = {
+    'items':           ([path.join(script_dir, 'import_stringdb_items.sh')], ()),
+    'network':         ([path.join(script_dir, 'import_stringdb_network.sh')], ()),
+    'evidence-scores': ([path.join(script_dir, 'import_stringdb_evidence_scores.sh')], ('network',)),
+    'homology':        ([path.join(script_dir, 'import_stringdb_homology.sh')], ('items',)),
+    'go-mapping':      ([path.join(script_dir, 'import_all_go_knowledge_explicit.sh')], ('items',)),
+    'uniprot':         ([path.join(script_dir, 'import_full_uniprot_2_string.sh')], ('items',)),
+    'swissprot':       ([sys.executable, path.join(script_dir, 'import_swissprot.py')], ('uniprot',)),
+}
+
+
+def run_stage(name):
+    command, _ = STAGES[name]
+
+    print(f'[{name}] started', file=sys.stderr)
+    start = time.perf_counter()
+
+    subprocess.run(command, check=True)
+
+    elapsed = time.perf_counter() - start
+    print(f'[{name}] done in {elapsed:.1f}s', file=sys.stderr)
+
+    return elapsed
+
+def run_pipeline(stages, n_jobs=None):
+    pending = {name: set(deps) & set(stages) for name, (_, deps) in STAGES.items() if name in stages}
+    timings = {}
+    failed = []
+
+    with concurrent.futures.ThreadPoolExecutor(n_jobs or len(pending)) as executor:
+        running = {}
+
+        while pending or running:
+            if not failed:
+                ready = [name for name, deps in pending.items() if deps <= timings.keys()]
+
+                for name in ready:
+                    del pending[name]
+                    running[executor.submit(run_stage, name)] = name
+
+            if not running:
+                break
+
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done:
+                name = running.pop(future)
+
+                try:
+                    timings[name] = future.result()
+                except subprocess.CalledProcessError as e:
+                    print(f'[{name}] failed with exit code {e.returncode}', file=sys.stderr)
+                    failed.append(name)
+
+    return timings, failed, sorted(pending)
+
+
+if __name__ == '__main__':
+    args, options = cli.parse_options(sys.argv)
+
+    stages = args[1:] or list(STAGES)
+    unknown = [name for name in stages if name not in STAGES]
+
+    if unknown:
+        print('unknown stages:', *unknown, file=sys.stderr)
+        sys.exit(1)
+
+    n_jobs = int(options['jobs']) if 'jobs' in options else None
+
+    os.environ['STRINGDB_MAINTENANCE_WORKERS'] = str(int(options.get('maintenance-workers', 4)))
+
+    start = time.perf_counter()
+    timings, failed, skipped = run_pipeline(stages, n_jobs)
+    elapsed = time.perf_counter() - start
+
+    for name in stages:
+        if name in timings:
+            print(f'{name:>16}: {timings[name]:.1f}s', file=sys.stderr)
+        elif name in failed:
+            print(f'{name:>16}: failed', file=sys.stderr)
+        else:
+            print(f'{name:>16}: skipped', file=sys.stderr)
+
+    print(f'{"total":>16}: {elapsed:.1f}s', file=sys.stderr)
+
+    if failed or skipped:
+        sys.exit(1)
+
+    subprocess.run([sys.executable, path.join(script_dir, 'stringdb_cache.py'), 'invalidate', 'stringdb'], check=True)
@@ -11,10 +11,6 @@ die() {
 
 script_dir="$(dirname "$0")"
 
-"$script_dir/import_stringdb_items.sh"
-"$script_dir/import_stringdb_network.sh"
-"$script_dir/import_stringdb_homology.sh"
-
-"$script_dir/import_all_go_knowledge_explicit.sh"
-"$script_dir/import_full_uniprot_2_string.sh"
-python "$script_dir/import_swissprot.py"
+# stages run concurrently where their dependencies allow it, see
+# recreate_stringdb.py for the stage graph
+python "$script_dir/recreate_stringdb.py" "$@"
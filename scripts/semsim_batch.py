@@ -0,0 +1,76 @@
+import numpy as np
+
+
+# best-match-average comparisons of many proteins at once.
+#
+# term_tables[k] is the term x term score table of namespace k, over the
+# integer codes used in prot_terms[k], which holds the term codes of every
+# protein in that namespace. reduce picks the best match (np.maximum for
+# similarities, np.minimum for dissimilarities), and the score of a pair is the
+# average of the mean best match in each direction. Pairs where a protein has no
+# terms in the namespace score 0.
+#
+# Tables that are np.memmap files are pickled as their file name, so that pool
+# workers map the same file instead of receiving a copy. table_dir, if given,
+# is the tempfile.TemporaryDirectory holding them, which is removed together
+# with the comparer.
+class BatchComparer:
+    def __init__(self, reduce, term_tables, prot_terms, table_dir=None):
+        self.reduce = reduce
+        self.term_tables = term_tables
+        self.prot_terms = prot_terms
+        self.table_dir = table_dir
+
+    def __getstate__(self):
+        state = dict(self.__dict__, table_dir=None)
+        state['term_tables'] = [(table.filename, table.dtype.str, table.shape) if isinstance(table, np.memmap) else table
+                                for table in self.term_tables]
+        return state
+
+    def __setstate__(self, state):
+        state['term_tables'] = [np.memmap(table[0], dtype=table[1], mode='r', shape=table[2]) if isinstance(table, tuple) else table
+                                for table in state['term_tables']]
+        self.__dict__.update(state)
+
+    def __len__(self):
+        return len(self.prot_terms[0])
+
+    def compare_tile(self, i0, i1, j0, j1):
+        tile_mats = np.zeros((len(self.term_tables), i1 - i0, j1 - j0))
+
+        for k, (table, prot_terms) in enumerate(zip(self.term_tables, self.prot_terms)):
+            cols = [j for j in range(j0, j1) if len(prot_terms[j]) > 0]
+            if not cols:
+                continue
+
+            lens = np.array([len(prot_terms[j]) for j in cols])
+            offsets = np.concatenate([[0], np.cumsum(lens)[:-1]])
+            col_terms = np.concatenate([prot_terms[j] for j in cols])
+
+            for i in range(i0, i1):
+                row_terms = prot_terms[i]
+                if len(row_terms) == 0:
+                    continue
+
+                scores = table[np.ix_(row_terms, col_terms)]
+
+                row_best = self.reduce.reduceat(scores, offsets, axis=1).mean(axis=0)
+                col_best = np.add.reduceat(self.reduce.reduce(scores, axis=0), offsets) / lens
+
+                tile_mats[k, i - i0, np.array(cols) - j0] = (row_best + col_best) / 2
+
+        return tile_mats
+
+
+def encode_prot_terms(split_annotations, n_namespaces):
+    terms = []
+    prot_terms = []
+
+    for k in range(n_namespaces):
+        ns_terms = sorted({go for ann in split_annotations for go in ann[k+1]})
+        codes = {go: code for code, go in enumerate(ns_terms)}
+
+        terms.append(ns_terms)
+        prot_terms.append([np.array([codes[go] for go in ann[k+1]], dtype=np.intp) for ann in split_annotations])
+
+    return terms, prot_terms
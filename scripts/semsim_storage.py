@@ -0,0 +1,115 @@
+import json
+import numpy as np
+import sys
+
+
+LAYOUTS = ('dense', 'packed')
+
+
+def get_packed_row_offsets(n):
+    rows = np.arange(n, dtype=np.int64)
+    return rows * n - rows * (rows - 1) // 2
+
+def get_store_meta_path(store_path):
+    return store_path + '.json'
+
+
+# symmetric (dis)similarity matrices, one layer per namespace.
+#
+# 'dense' keeps full n x n layers, 'packed' keeps only the row-major upper
+# triangle (diagonal included), so cell (i, j) with i <= j is found at
+# row_offsets[i] + j - i. Layers live in memory, or in an np.memmap file when a
+# path is given; its shape, dtype and protein ids go to a json file next to it.
+class ComparisonMatrixStore:
+    def __init__(self, protein_ids, layers, dtype='float64', layout='dense', path=None, mode='w+'):
+        if layout not in LAYOUTS:
+            raise ValueError(f'unknown matrix layout: {layout}')
+
+        self.protein_ids = list(protein_ids)
+        self.layers = tuple(layers)
+        self.dtype = np.dtype(dtype)
+        self.layout = layout
+        self.path = path
+
+        n = len(self.protein_ids)
+
+        if layout == 'dense':
+            shape = (len(self.layers), n, n)
+        else:
+            shape = (len(self.layers), n * (n + 1) // 2)
+            self.row_offsets = get_packed_row_offsets(n)
+
+        if path is None:
+            self.values = np.zeros(shape, dtype=self.dtype)
+        else:
+            self.values = np.memmap(path, dtype=self.dtype, mode=mode, shape=shape)
+
+            if mode != 'r':
+                self.save_meta()
+
+    @property
+    def n(self):
+        return len(self.protein_ids)
+
+    def save_meta(self):
+        meta = {
+            'protein_ids': self.protein_ids,
+            'layers': self.layers,
+            'dtype': self.dtype.name,
+            'byteorder': sys.byteorder,
+            'layout': self.layout
+        }
+
+        with open(get_store_meta_path(self.path), 'w') as meta_f:
+            json.dump(meta, meta_f)
+
+    @classmethod
+    def open(cls, path, mode='r'):
+        with open(get_store_meta_path(path)) as meta_f:
+            meta = json.load(meta_f)
+
+        return cls(meta['protein_ids'], meta['layers'], meta['dtype'], meta['layout'], path=path, mode=mode)
+
+    def flush(self):
+        if self.path is not None:
+            self.values.flush()
+
+    # tile_mats holds rows i0:i1 and columns j0:j1, with i0 <= j0; cells
+    # below the diagonal are ignored
+    def set_tile(self, i0, i1, j0, j1, tile_mats):
+        if self.layout == 'dense':
+            if i0 == j0:
+                lower = np.tril_indices(i1 - i0, -1)
+                tile_mats = tile_mats.copy()
+                tile_mats[:, lower[0], lower[1]] = tile_mats[:, lower[1], lower[0]]
+
+            self.values[:, i0:i1, j0:j1] = tile_mats
+            self.values[:, j0:j1, i0:i1] = tile_mats.transpose(0, 2, 1)
+
+        else:
+            for i in range(i0, min(i1, j1)):
+                j_start = max(i, j0)
+                offset = self.row_offsets[i] + j_start - i
+
+                self.values[:, offset:offset + j1 - j_start] = tile_mats[:, i - i0, j_start - j0:]
+
+    def row_block(self, start, stop):
+        if self.layout == 'dense':
+            return self.values[:, start:stop]
+
+        block = np.empty((len(self.layers), stop - start, self.n), dtype=self.dtype)
+
+        for i in range(start, stop):
+            # columns left of the diagonal are read down column i of the
+            # packed upper triangle
+            lower = self.row_offsets[:i] + i - np.arange(i)
+            offset = self.row_offsets[i]
+
+            block[:, i - start, :i] = self.values[:, lower]
+            block[:, i - start, i:] = self.values[:, offset:offset + self.n - i]
+
+        return block
+
+    def iter_row_blocks(self, block_size=1024):
+        for start in range(0, self.n, block_size):
+            yield start, self.row_block(start, min(start + block_size, self.n))
@@ -1,11 +1,18 @@
+import contextlib
 import csv
+import functools
+import io
 import itertools
 import networkx as nx
+import numpy as np
 #import obonet
+import os
 import pandas as pd
 import pronto
 import sys
 
+import instrument
+
 
 def connect_to_localhost(*, dbname='stringdb', user='stringdb'):
     import psycopg2
@@ -15,8 +22,8 @@ def connect_through_docker_network(*, dbname='stringdb', user='stringdb'):
     import psycopg2
     return psycopg2.connect(host='stringdb', port=5432, user=user, password='stringdb', dbname=dbname)
 
-def connect_to_docker(*, dbname='stringdb', project='stringdb', service='stringdb'):
-    import psycopg2
+@functools.lru_cache(maxsize=None)
+def _resolve_docker_address(project, service):
     import docker
 
     docker_client = docker.from_env()
@@ -38,7 +45,78 @@ def connect_to_docker(*, dbname='stringdb', project='stringdb', service='stringd
     host = network_settings['Networks']['stringdb-net']['IPAddress']
     env = dict(e.split('=', 1) for e in container.attrs['Config']['Env'])
 
-    return psycopg2.connect(host=host, port=5432, user=env['POSTGRES_USER'], password=env['POSTGRES_PASSWORD'], dbname=dbname)
+    return host, env['POSTGRES_USER'], env['POSTGRES_PASSWORD']
+
+def resolve_docker_address(*, project='stringdb', service='stringdb'):
+    host, user, password = _resolve_docker_address(project, service)
+    return {'host': host, 'port': 5432, 'user': user, 'password': password}
+
+def connect_to_docker(*, dbname='stringdb', project='stringdb', service='stringdb'):
+    import psycopg2
+    return psycopg2.connect(dbname=dbname, **resolve_docker_address(project=project, service=service))
+
+
+# pool of connections that share one resolved address. cursor(name) hands out
+# server-side cursors, which fetch large results in chunks of itersize rows
+# instead of loading them whole into client memory. With STRINGDB_METRICS set,
+# its cursors record the timing and row count of every query.
+class Session:
+    def __init__(self, *, minconn=1, maxconn=4, **connect_kwargs):
+        import psycopg2.pool
+
+        if instrument.enabled():
+            connect_kwargs.setdefault('cursor_factory', instrument.get_cursor_factory())
+
+        self.pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+
+    def getconn(self):
+        return self.pool.getconn()
+
+    def putconn(self, conn):
+        self.pool.putconn(conn)
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.getconn()
+
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.putconn(conn)
+
+    @contextlib.contextmanager
+    def cursor(self, name=None, *, itersize=10000):
+        with self.connection() as conn:
+            with conn.cursor(name) as cursor:
+                cursor.itersize = itersize
+                yield cursor
+
+    def close(self):
+        self.pool.closeall()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_sessions = {}
+
+# STRINGDB_DBNAME points the default session and cache at another database of
+# the same service, e.g. the synthetic one of the benchmarks
+def get_default_dbname():
+    return os.environ.get('STRINGDB_DBNAME', 'stringdb')
+
+def get_docker_session(*, dbname=None, project='stringdb', service='stringdb', maxconn=4):
+    dbname = dbname or get_default_dbname()
+    key = (dbname, project, service)
+
+    if key not in _sessions or _sessions[key].pool.closed:
+        _sessions[key] = Session(maxconn=maxconn, dbname=dbname, **resolve_docker_address(project=project, service=service))
+
+    return _sessions[key]
 
 
 
@@ -65,18 +143,13 @@ def get_prots_external_ids(cursor, string_ids):
 def get_species_network_scores(cursor, species_id, score_type):
     cursor.execute("""
         select
-          evidence_scores[i][2] evidence_score
-        from (
-          select
-            evidence_scores,
-            generate_subscripts(evidence_scores, 1) as i
-          from
-            network.node_node_links
-          where
-            node_type_b = %(species_id)s
-        ) as indexed_scores
+          score evidence_score
+        from
+          network.evidence_scores
         where
-          evidence_scores[i][1] = %(score_type)s;
+          node_type_b = %(species_id)s
+          and
+          score_type = %(score_type)s;
         """,
         {'species_id': species_id, 'score_type': score_type})
 
@@ -97,8 +170,11 @@ def get_explicit_annotations(cursor, go_id, evidence_codes):
 
     return [string_id for string_id, in cursor.fetchall()]
 
-def count_annotations(cursor, go_is_a_g, go_id, evidence_codes):
-    gos = tuple(nx.ancestors(go_is_a_g, go_id)) + (go_id,)
+def count_annotations(cursor, go_is_a_g, go_id, evidence_codes, closure=None):
+    if closure is None:
+        gos = tuple(nx.ancestors(go_is_a_g, go_id)) + (go_id,)
+    else:
+        gos = tuple(closure.ancestors(go_id)) + (go_id,)
 
     cursor.execute("""
         select
@@ -115,6 +191,22 @@ def count_annotations(cursor, go_is_a_g, go_id, evidence_codes):
     [(cnt,)] = cursor.fetchall()
     return cnt
 
+def get_all_explicit_annotations(cursor, evidence_codes):
+    cursor.execute("""
+        select distinct
+          go_id,
+          string_id
+        from
+          mapping.gene_ontology
+        where
+          string_id is not null
+          and
+          evidence_code in %(evidence_codes)s;
+        """,
+        {'evidence_codes': evidence_codes})
+
+    yield from cursor
+
 def get_explicit_prot_annotations(cursor, prot_string_id, evidence_codes):
     cursor.execute("""
         select
@@ -130,12 +222,84 @@ def get_explicit_prot_annotations(cursor, prot_string_id, evidence_codes):
 
     return [go_id for go_id, in cursor.fetchall()]
 
-def get_prot_annotations(cursor, go_is_a_g, prot_string_id, evidence_codes):
+def get_species_explicit_annotations(cursor, species_id, evidence_codes):
+    cursor.execute("""
+        select distinct
+          string_id,
+          go_id
+        from
+          mapping.gene_ontology
+        where
+          species_id = %(species_id)s
+          and
+          string_id is not null
+          and
+          evidence_code in %(evidence_codes)s
+        order by
+          string_id, go_id;
+        """,
+        {'species_id': species_id, 'evidence_codes': evidence_codes})
+
+    return [(string_id, [go_id for _, go_id in rows])
+            for string_id, rows in itertools.groupby(cursor, key=lambda row: row[0])]
+
+# remapping maps go_old_id to its new go_id, or to None when the term no longer
+# has a valid alternative; only the rows of those terms are touched
+def remap_gene_ontology_terms(cursor, remapping):
+    cursor.execute("""
+        drop table if exists tmp_go_remap;
+
+        create temporary table tmp_go_remap (
+            go_old_id text not null,
+            go_new_id text
+        );
+        """)
+
+    null = '\\N'
+    remap_lines = ''.join(f'{go_old_id}\t{go_new_id or null}\n' for go_old_id, go_new_id in remapping.items())
+    cursor.copy_from(io.StringIO(remap_lines), 'tmp_go_remap', columns=('go_old_id', 'go_new_id'))
+
+    cursor.execute("""
+        analyze tmp_go_remap;
+
+        delete from
+          mapping.gene_ontology go
+        using
+          tmp_go_remap remap
+        where
+          go.go_old_id = remap.go_old_id
+          and
+          remap.go_new_id is null;
+        """)
+    n_deleted = cursor.rowcount
+
+    cursor.execute("""
+        update
+          mapping.gene_ontology go
+        set
+          go_id = remap.go_new_id
+        from
+          tmp_go_remap remap
+        where
+          go.go_old_id = remap.go_old_id
+          and
+          go.go_id is distinct from remap.go_new_id;
+        """)
+    n_updated = cursor.rowcount
+
+    cursor.execute('drop table tmp_go_remap;')
+
+    return n_updated, n_deleted
+
+def get_prot_annotations(cursor, go_is_a_g, prot_string_id, evidence_codes, closure=None):
     explicit_anns = get_explicit_prot_annotations(cursor, prot_string_id, evidence_codes)
     anns = set(explicit_anns)
 
     for go_id in explicit_anns:
-        anns.update(nx.descendants(go_is_a_g, go_id))
+        if closure is None:
+            anns.update(nx.descendants(go_is_a_g, go_id))
+        else:
+            anns.update(closure.descendants(go_id))
 
     return anns
 
@@ -166,40 +330,263 @@ def get_species_prots(cursor, species_id):
 def get_species_prots_uniprot(cursor, species_id, min_identity):
     cursor.execute("""
         select
-          protein_id string_id,
-          array(
-            select
-              uniprot_ac
-            from
-              mapping.uniprot
-            where
-              species_id = %(species_id)s
-              and
-              string_id = protein_id
-              and
-              identity >= %(min_identity)s)
+          prots.protein_id string_id,
+          coalesce(
+            array_agg(uni.uniprot_ac) filter (where uni.uniprot_ac is not null),
+            '{}')
             uniprot_ac
         from
-          items.proteins
+          items.proteins prots
+          left join
+            mapping.uniprot uni
+          on
+            uni.species_id = prots.species_id
+            and
+            uni.string_id = prots.protein_id
+            and
+            uni.identity >= %(min_identity)s
         where
-          species_id = %(species_id)s;
+          prots.species_id = %(species_id)s
+        group by
+          prots.protein_id;
         """,
         {'species_id': species_id, 'min_identity': min_identity})
 
     return cursor.fetchall()
 
+# like map_uniprot_to_string, but returns the raw (uniprot_ac, string_id) rows,
+# including accessions whose string_id is null
 def get_uniprot_species_id(cursor, species_id, uniprot_acs):
+    copy_ids_to_temp_table(cursor, 'tmp_uniprot_acs', 'text', frozenset(uniprot_acs))
+
+    cursor.execute("""
+        select
+          uni.uniprot_ac,
+          uni.string_id
+        from
+          tmp_uniprot_acs ids
+          inner join
+            mapping.uniprot uni
+          on
+            uni.uniprot_ac = ids.id
+        where
+          uni.species_id = %(species_id)s;
+        """,
+        {'species_id': species_id})
+
+    rows = cursor.fetchall()
+    cursor.execute('drop table tmp_uniprot_acs;')
+
+    return rows
+
+
+UNIPROT_MAPPING_COLUMNS = ('uniprot_ac', 'string_id', 'identity')
+
+def read_frame(cursor, columns, batch_size=100000):
+    frames = [pd.DataFrame([], columns=columns)]
+
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+
+        frames.append(pd.DataFrame.from_records(rows, columns=columns))
+
+    return pd.concat(frames, ignore_index=True)
+
+def get_species_uniprot_mapping(cursor, species_id):
     cursor.execute("""
         select
           uniprot_ac,
-          string_id
+          string_id,
+          identity
         from
           mapping.uniprot
         where
           species_id = %(species_id)s
           and
-          uniprot_ac in %(uniprot_acs)s;
+          string_id is not null;
         """,
-        {'species_id': species_id, 'uniprot_acs': tuple(uniprot_acs)})
+        {'species_id': species_id})
 
-    return cursor.fetchall()
+    return read_frame(cursor, UNIPROT_MAPPING_COLUMNS)
+
+def copy_ids_to_temp_table(cursor, table_name, id_type, ids):
+    cursor.execute(f"""
+        drop table if exists {table_name};
+
+        create temporary table {table_name} (
+            id {id_type} not null
+        );
+        """)
+
+    cursor.copy_from(io.StringIO(''.join(f'{id}\n' for id in ids)), table_name, columns=('id',))
+    cursor.execute(f'analyze {table_name};')
+
+def _split_unmapped(mapping, id_column, other_column, kind, verbose=False):
+    unmapped = mapping[id_column][mapping[other_column].isnull()].tolist()
+    mapping = mapping[mapping[other_column].notnull()].reset_index(drop=True).astype({'string_id': np.int64})
+
+    if verbose:
+        print(f' > {len(unmapped)} unmapped {kind}', file=sys.stderr)
+
+    return mapping, unmapped
+
+# resolves any number of accessions with a single join against a temporary
+# table loaded by COPY. Returns the (uniprot_ac, string_id, identity) rows that
+# pass min_identity and the accessions that have none.
+def map_uniprot_to_string(cursor, uniprot_acs, species_id=None, min_identity=None, verbose=False):
+    copy_ids_to_temp_table(cursor, 'tmp_uniprot_acs', 'text', frozenset(uniprot_acs))
+
+    cursor.execute("""
+        select
+          ids.id uniprot_ac,
+          uni.string_id,
+          uni.identity
+        from
+          tmp_uniprot_acs ids
+          left join
+            mapping.uniprot uni
+          on
+            uni.uniprot_ac = ids.id
+            and
+            uni.string_id is not null
+            and
+            (%(species_id)s is null or uni.species_id = %(species_id)s)
+            and
+            uni.identity >= %(min_identity)s;
+        """,
+        {'species_id': species_id, 'min_identity': min_identity or 0})
+
+    mapping = read_frame(cursor, UNIPROT_MAPPING_COLUMNS)
+    cursor.execute('drop table tmp_uniprot_acs;')
+
+    return _split_unmapped(mapping, 'uniprot_ac', 'string_id', 'uniprot accessions', verbose)
+
+def map_string_to_uniprot(cursor, string_ids, min_identity=None, verbose=False):
+    copy_ids_to_temp_table(cursor, 'tmp_string_ids', 'integer', frozenset(string_ids))
+
+    cursor.execute("""
+        select
+          uni.uniprot_ac,
+          ids.id string_id,
+          uni.identity
+        from
+          tmp_string_ids ids
+          left join
+            mapping.uniprot uni
+          on
+            uni.string_id = ids.id
+            and
+            uni.identity >= %(min_identity)s;
+        """,
+        {'min_identity': min_identity or 0})
+
+    mapping = read_frame(cursor, UNIPROT_MAPPING_COLUMNS)
+    cursor.execute('drop table tmp_string_ids;')
+
+    return _split_unmapped(mapping, 'string_id', 'uniprot_ac', 'string ids', verbose)
+
+
+# in-memory hash index over the uniprot mapping of one species (see
+# get_species_uniprot_mapping, or Cache.get_species_uniprot_mapping for a copy
+# cached on disk), resolving ids in both directions without a round trip
+class UniprotIndex:
+    def __init__(self, mapping):
+        self.mapping = mapping
+
+    def _map(self, ids, id_column, other_column, min_identity, kind, verbose):
+        mapping = self.mapping
+        if min_identity is not None:
+            mapping = mapping[mapping.identity >= min_identity]
+
+        ids = pd.DataFrame({id_column: pd.unique(pd.Series(list(ids), dtype=mapping[id_column].dtype))})
+        mapped = ids.merge(mapping, on=id_column, how='left')[list(UNIPROT_MAPPING_COLUMNS)]
+
+        return _split_unmapped(mapped, id_column, other_column, kind, verbose)
+
+    def to_string(self, uniprot_acs, min_identity=None, verbose=False):
+        return self._map(uniprot_acs, 'uniprot_ac', 'string_id', min_identity, 'uniprot accessions', verbose)
+
+    def to_uniprot(self, string_ids, min_identity=None, verbose=False):
+        return self._map(string_ids, 'string_id', 'uniprot_ac', min_identity, 'string ids', verbose)
+
+
+HOMOLOGY_COLUMNS = ('string_id_a', 'string_id_b', 'species_id_b', 'bitscore')
+HOMOLOGY_DTYPES = (np.int64, np.int64, np.int32, np.float32)
+
+# reads the hits in batches of batch_size rows, one numpy array per column, so
+# with a named (server-side) cursor whole proteomes are scanned without holding
+# the rows as python tuples
+def read_homology_frame(cursor, batch_size=100000):
+    columns = [[np.empty(0, dtype=dtype)] for dtype in HOMOLOGY_DTYPES]
+
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+
+        for column, values, dtype in zip(columns, zip(*rows), HOMOLOGY_DTYPES):
+            column.append(np.array(values, dtype=dtype))
+
+    return pd.DataFrame({name: np.concatenate(column) for name, column in zip(HOMOLOGY_COLUMNS, columns)},
+                        columns=HOMOLOGY_COLUMNS)
+
+# homology.blast_data only keeps bitscores (alignment identities are not part of
+# the STRING dump), so hits are filtered by min_bitscore. With best_only, only
+# the hits with the highest bitscore of each protein of species_id_a are kept.
+def get_species_homologs(cursor, species_id_a, species_id_b, min_bitscore=None, best_only=False):
+    cursor.execute(f"""
+        select {'distinct on (protein_id_a)' if best_only else ''}
+          protein_id_a,
+          protein_id_b,
+          species_id_b,
+          bitscore
+        from
+          homology.blast_data
+        where
+          species_id_a = %(species_id_a)s
+          and
+          species_id_b = %(species_id_b)s
+          and
+          bitscore >= %(min_bitscore)s
+        {'order by protein_id_a, bitscore desc, protein_id_b' if best_only else ''};
+        """,
+        {'species_id_a': species_id_a, 'species_id_b': species_id_b, 'min_bitscore': min_bitscore or 0})
+
+    return read_homology_frame(cursor)
+
+def get_prots_homologs(cursor, string_ids, species_id_b=None, min_bitscore=None, best_only=False):
+    cursor.execute(f"""
+        select {'distinct on (protein_id_a, species_id_b)' if best_only else ''}
+          protein_id_a,
+          protein_id_b,
+          species_id_b,
+          bitscore
+        from
+          homology.blast_data
+        where
+          protein_id_a = any(%(string_ids)s)
+          and
+          (%(species_id_b)s is null or species_id_b = %(species_id_b)s)
+          and
+          bitscore >= %(min_bitscore)s
+        {'order by protein_id_a, species_id_b, bitscore desc, protein_id_b' if best_only else ''};
+        """,
+        {'string_ids': list(string_ids), 'species_id_b': species_id_b, 'min_bitscore': min_bitscore or 0})
+
+    return read_homology_frame(cursor)
+
+# annotations of the proteins on the b side of hits, as (string_id, go_ids)
+# pairs of the a side
+def transfer_annotations(hits, annotations):
+    annotations = pd.DataFrame(
+        [(string_id, go_id) for string_id, gos in annotations for go_id in gos],
+        columns=['string_id_b', 'go_id'])
+
+    transferred = hits[['string_id_a', 'string_id_b']].merge(annotations, on='string_id_b')
+    transferred = transferred.drop_duplicates(['string_id_a', 'go_id']).sort_values(['string_id_a', 'go_id'])
+
+    prot_gos = transferred.groupby('string_id_a', sort=True).go_id.agg(list)
+
+    return list(zip(prot_gos.index.tolist(), prot_gos.tolist()))
@@ -0,0 +1,151 @@
+from os import path
+import hashlib
+import os
+import pandas as pd
+import shutil
+import sys
+
+import stringdb
+
+
+DEFAULT_MAX_SIZE = 8 * 1024**3
+
+
+def get_cache_dir():
+    script_dir = path.dirname(path.realpath(__file__))
+    stringdb_dir = path.dirname(script_dir)
+
+    return path.join(stringdb_dir, 'cache', 'extracts')
+
+
+def get_params_digest(params):
+    return hashlib.sha1(repr(params).encode()).hexdigest()[:16]
+
+
+def write_frame(frame_path, frame):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    tmp_path = frame_path + '.tmp'
+
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    os.replace(tmp_path, frame_path)
+
+def read_frame(frame_path):
+    import pyarrow as pa
+
+    # uncompressed arrow files are memory-mapped, so columns are read
+    # without copying them through the python heap
+    with pa.memory_map(frame_path, 'r') as source:
+        return pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+
+
+# on-disk cache of query extracts of one database, stored as arrow files under
+# <cache_dir>/<name>/<species_id>/<query>-<params digest>.arrow. Entries are
+# evicted in least-recently-used order once the cache exceeds max_size bytes,
+# and the whole cache of a database is dropped by invalidate() after a reimport.
+class Cache:
+    def __init__(self, get_session, name, cache_dir=None, max_size=None):
+        self.get_session = get_session
+        self.name = name
+        self.cache_dir = path.join(cache_dir or get_cache_dir(), name)
+        self.max_size = max_size or int(os.environ.get('STRINGDB_CACHE_SIZE', DEFAULT_MAX_SIZE))
+
+    def get_entry_path(self, species_id, query, params):
+        species_dir = 'all' if species_id is None else str(species_id)
+        return path.join(self.cache_dir, species_dir, f'{query}-{get_params_digest(params)}.arrow')
+
+    def frame(self, species_id, query, params, fetch):
+        entry_path = self.get_entry_path(species_id, query, params)
+
+        if path.exists(entry_path):
+            os.utime(entry_path)
+            return read_frame(entry_path)
+
+        with self.get_session().cursor() as cursor:
+            frame = fetch(cursor)
+
+        os.makedirs(path.dirname(entry_path), exist_ok=True)
+        write_frame(entry_path, frame)
+        self.evict()
+
+        return frame
+
+    def iter_entries(self):
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith('.arrow'):
+                    entry_path = path.join(dirpath, filename)
+                    yield entry_path, os.stat(entry_path)
+
+    def evict(self):
+        entries = sorted(self.iter_entries(), key=lambda entry: entry[1].st_mtime)
+        total_size = sum(stat.st_size for _, stat in entries)
+
+        for entry_path, stat in entries:
+            if total_size <= self.max_size:
+                break
+
+            os.remove(entry_path)
+            total_size -= stat.st_size
+
+    def invalidate(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def get_species_prots(self, species_id):
+        frame = self.frame(species_id, 'species_prots', (), lambda cursor:
+            pd.DataFrame({'string_id': stringdb.get_species_prots(cursor, species_id)}, columns=['string_id']))
+
+        return frame.string_id.tolist()
+
+    def get_prots_external_ids(self, string_ids):
+        string_ids = sorted(frozenset(string_ids))
+
+        return self.frame(None, 'prots_external_ids', tuple(string_ids), lambda cursor:
+            stringdb.get_prots_external_ids(cursor, string_ids))
+
+    def get_species_explicit_annotations(self, species_id, evidence_codes):
+        def fetch(cursor):
+            annotations = stringdb.get_species_explicit_annotations(cursor, species_id, evidence_codes)
+
+            return pd.DataFrame(
+                [(string_id, go_id) for string_id, gos in annotations for go_id in gos],
+                columns=['string_id', 'go_id'])
+
+        frame = self.frame(species_id, 'species_explicit_annotations', tuple(sorted(evidence_codes)), fetch)
+        prot_gos = frame.groupby('string_id', sort=True).go_id.agg(list)
+
+        return list(zip(prot_gos.index.tolist(), prot_gos.tolist()))
+
+    def get_species_uniprot_mapping(self, species_id):
+        return self.frame(species_id, 'species_uniprot_mapping', (), lambda cursor:
+            stringdb.get_species_uniprot_mapping(cursor, species_id))
+
+    def get_uniprot_index(self, species_id):
+        return stringdb.UniprotIndex(self.get_species_uniprot_mapping(species_id))
+
+    def get_species_network_scores(self, species_id, score_type):
+        frame = self.frame(species_id, 'species_network_scores', (score_type,), lambda cursor:
+            pd.DataFrame({'evidence_score': stringdb.get_species_network_scores(cursor, species_id, score_type)}, columns=['evidence_score']))
+
+        return frame.evidence_score.tolist()
+
+
+def get_docker_cache(*, dbname=None, project='stringdb', service='stringdb'):
+    dbname = dbname or stringdb.get_default_dbname()
+    return Cache(lambda: stringdb.get_docker_session(dbname=dbname, project=project, service=service), dbname)
+
+
+if __name__ == '__main__':
+    cmd = sys.argv[1]
+
+    if cmd == 'invalidate':
+        for name in sys.argv[2:] or [stringdb.get_default_dbname()]:
+            Cache(None, name).invalidate()
+            print(f'invalidated cache of {name}', file=sys.stderr)
+
+    else:
+        print('unknown command:', cmd, file=sys.stderr)
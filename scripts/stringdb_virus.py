@@ -1,7 +1,11 @@
 import csv
+import functools
+import numpy as np
 import pandas as pd
 
+import instrument
 import stringdb
+import stringdb_cache
 
 
 def connect_to_localhost(*, dbname='stringdb_virus', user='helen'):
@@ -13,8 +17,36 @@ def connect_through_docker_network(*, dbname='stringdb_virus', user='helen'):
 def connect_to_docker(*, dbname='stringdb_virus', project='stringdb-virus', service='stringdb-virus'):
     return stringdb.connect_to_docker(dbname=dbname, project=project, service=service)
 
+def get_docker_session(*, dbname='stringdb_virus', project='stringdb-virus', service='stringdb-virus', maxconn=4):
+    return stringdb.get_docker_session(dbname=dbname, project=project, service=service, maxconn=maxconn)
+
+def get_docker_cache(*, dbname='stringdb_virus', project='stringdb-virus', service='stringdb-virus'):
+    return stringdb_cache.get_docker_cache(dbname=dbname, project=project, service=service)
+
+
+# the interaction queries read network.evidence_scores, which the virus
+# database only has once it has been built there with
+#
+#   scripts/import_stringdb_evidence_scores.sh stringdb-virus stringdb-virus stringdb_virus helen
+def _reads_evidence_scores(fn):
+    @functools.wraps(fn)
+    def wrapper(cursor, *args, **kwargs):
+        import psycopg2.errors
+
+        try:
+            return fn(cursor, *args, **kwargs)
+        except psycopg2.errors.UndefinedTable as e:
+            if 'evidence_scores' not in str(e):
+                raise
+
+            raise RuntimeError('network.evidence_scores does not exist in this database, build it with '
+                               'scripts/import_stringdb_evidence_scores.sh <project> <service> <dbname> <user>') from e
+
+    return wrapper
+
 
 # species-species interactions only
+@_reads_evidence_scores
 def get_species_interactions(cursor, species_ids, score_types):
     cursor.execute("""
         select
@@ -22,25 +54,16 @@ def get_species_interactions(cursor, species_ids, score_types):
           node_type_b,
           node_id_a,
           node_id_b,
-          evidence_scores[i][1] score_type,
-          evidence_scores[i][2] evidence_score
-        from (
-          select
-            node_type_a,
-            node_type_b,
-            node_id_a,
-            node_id_b,
-            evidence_scores,
-            generate_subscripts(evidence_scores, 1) as i
-          from
-            network.node_node_links
-          where
-            node_type_a in %(species_ids)s
-            and
-            node_type_a = node_type_b
-        ) as indexed_scores
+          score_type,
+          score evidence_score
+        from
+          network.evidence_scores
         where
-          evidence_scores[i][1] in %(score_types)s;
+          node_type_a in %(species_ids)s
+          and
+          node_type_a = node_type_b
+          and
+          score_type in %(score_types)s;
         """,
         {'species_ids': tuple(species_ids),
          'score_types': tuple(score_types)})
@@ -51,37 +74,29 @@ def get_species_interactions(cursor, species_ids, score_types):
 
 
 # species-species interactions only
+@_reads_evidence_scores
 def get_protein_interactions(cursor, species_id, protein_ids, score_types):
-    if protein_ids:
+    if len(protein_ids) > 0:
         cursor.execute("""
             select
               node_type_a,
               node_type_b,
               node_id_a,
               node_id_b,
-              evidence_scores[i][1] score_type,
-              evidence_scores[i][2] evidence_score
-            from (
-              select
-                node_type_a,
-                node_type_b,
-                node_id_a,
-                node_id_b,
-                evidence_scores,
-                generate_subscripts(evidence_scores, 1) as i
-              from
-                network.node_node_links
-              where
-                node_type_b = %(species_id)s
-                and
-                node_type_a = %(species_id)s
-                and
-                node_id_a in %(protein_ids)s
-                and
-                node_id_b in %(protein_ids)s
-            ) as indexed_scores
+              score_type,
+              score evidence_score
+            from
+              network.evidence_scores
             where
-              evidence_scores[i][1] in %(score_types)s;
+              node_type_b = %(species_id)s
+              and
+              node_type_a = %(species_id)s
+              and
+              node_id_a in %(protein_ids)s
+              and
+              node_id_b in %(protein_ids)s
+              and
+              score_type in %(score_types)s;
             """,
             {'species_id': species_id,
              'protein_ids': tuple(protein_ids),
@@ -101,6 +116,7 @@ def get_protein_interactions(cursor, species_id, protein_ids, score_types):
 # virus-virus not included
 # virus-host included
 # host-virus included
+@_reads_evidence_scores
 def get_all_virus_host_interactions(cursor, host_species_id, score_types):
     cursor.execute("""
         select
@@ -108,27 +124,18 @@ def get_all_virus_host_interactions(cursor, host_species_id, score_types):
           node_type_b,
           node_id_a,
           node_id_b,
-          evidence_scores[i][1] score_type,
-          evidence_scores[i][2] evidence_score
-        from (
-          select
-            node_type_a,
-            node_type_b,
-            node_id_a,
-            node_id_b,
-            evidence_scores,
-            generate_subscripts(evidence_scores, 1) as i
-          from
-            network.node_node_links
-          where
-            ( node_type_b = %(host_species_id)s
-              or
-              node_type_a = %(host_species_id)s )
-            and
-            node_type_a != node_type_b
-        ) as indexed_scores
+          score_type,
+          score evidence_score
+        from
+          network.evidence_scores
         where
-          evidence_scores[i][1] in %(score_types)s;
+          ( node_type_b = %(host_species_id)s
+            or
+            node_type_a = %(host_species_id)s )
+          and
+          node_type_a != node_type_b
+          and
+          score_type in %(score_types)s;
         """,
         {'host_species_id': host_species_id,
          'score_types': tuple(score_types)})
@@ -165,6 +172,7 @@ def get_viruses_for_host(cursor, host_species_id):
 # virus-virus not included
 # virus-host included
 # host-virus included
+@_reads_evidence_scores
 def get_virus_host_interactions(cursor, host_species_id, virus_species_id, score_types):
     cursor.execute("""
         select
@@ -172,25 +180,16 @@ def get_virus_host_interactions(cursor, host_species_id, virus_species_id, score
           node_type_b,
           node_id_a,
           node_id_b,
-          evidence_scores[i][1] score_type,
-          evidence_scores[i][2] evidence_score
-        from (
-          select
-            node_type_a,
-            node_type_b,
-            node_id_a,
-            node_id_b,
-            evidence_scores,
-            generate_subscripts(evidence_scores, 1) as i
-          from
-            network.node_node_links
-          where
-            ( node_type_a = %(host_species_id)s and node_type_b = %(virus_species_id)s )
-            or
-            ( node_type_b = %(host_species_id)s and node_type_a = %(virus_species_id)s )
-        ) as indexed_scores
+          score_type,
+          score evidence_score
+        from
+          network.evidence_scores
         where
-          evidence_scores[i][1] in %(score_types)s;
+          ( ( node_type_a = %(host_species_id)s and node_type_b = %(virus_species_id)s )
+            or
+            ( node_type_b = %(host_species_id)s and node_type_a = %(virus_species_id)s ) )
+          and
+          score_type in %(score_types)s;
         """,
         {'host_species_id': host_species_id,
          'virus_species_id': virus_species_id,
@@ -221,47 +220,147 @@ def get_all_virus_host_networks(cursor, host_species_id, score_types):
 def get_virus_host_network(cursor, host_species_id, virus_species_id, score_types):
     vh = get_virus_host_interactions(cursor, host_species_id, virus_species_id, score_types)
 
-    node_ids = pd.concat([
-        vh.loc[:, ['node_type_a','node_id_a']].rename(columns={'node_type_a':'node_type', 'node_id_a':'node_id'}),
-        vh.loc[:, ['node_type_b','node_id_b']].rename(columns={'node_type_b':'node_type', 'node_id_b':'node_id'})
-    ])
+    node_types = np.concatenate([vh.node_type_a.to_numpy(), vh.node_type_b.to_numpy()])
+    node_ids = np.concatenate([vh.node_id_a.to_numpy(), vh.node_id_b.to_numpy()])
 
     vv = get_protein_interactions(
             cursor,
             virus_species_id,
-            node_ids.loc[node_ids.node_id == virus_species_id].node_id.to_numpy(),
+            np.unique(node_ids[node_types == virus_species_id]).tolist(),
             score_types)
 
     hh = get_protein_interactions(
             cursor,
             host_species_id,
-            node_ids.loc[node_ids.node_id == host_species_id].node_id.to_numpy(),
+            np.unique(node_ids[node_types == host_species_id]).tolist(),
             score_types)
 
-    return pd.concat([vh,vv,hh])
+    return pd.concat([vh,vv,hh], ignore_index=True)
 
 
-# maps node_id_a from string id's to string external id's
-#      node_id_b from string id's to string external id's
-def network_with_external_ids(cursor, network):
-    orig_columns = network.columns
+# batched get_virus_host_network for many viruses of one host (all of them
+# when virus_species_ids is None), in a single query. Returns a dict from virus
+# species id to its network:
+# virus-host included
+# host-virus included
+# host-host included (virus-host neighbors only)
+# virus-virus included (virus-host neighbors only)
+@_reads_evidence_scores
+def get_virus_host_networks(cursor, host_species_id, score_types, virus_species_ids=None):
+    if virus_species_ids is not None and len(virus_species_ids) == 0:
+        return {}
+
+    if virus_species_ids is None:
+        virus_filter = """
+              ( node_type_a = %(host_species_id)s or node_type_b = %(host_species_id)s )
+              and
+              node_type_a != node_type_b"""
+        # the host and virus species are only known from vh
+        species_filter = """
+          and
+          es.node_type_b in (select distinct node_type from vh_nodes)"""
+    else:
+        virus_filter = """
+              ( ( node_type_a = %(host_species_id)s and node_type_b in %(virus_species_ids)s )
+                or
+                ( node_type_b = %(host_species_id)s and node_type_a in %(virus_species_ids)s ) )"""
+        species_filter = """
+          and
+          es.node_type_b in %(species_ids)s"""
+
+    cursor.execute(f"""
+        with vh as (
+            select
+              case when node_type_a = %(host_species_id)s then node_type_b else node_type_a end virus_species_id,
+              node_type_a,
+              node_type_b,
+              node_id_a,
+              node_id_b,
+              score_type,
+              score evidence_score
+            from
+              network.evidence_scores
+            where{virus_filter}
+              and
+              score_type in %(score_types)s
+        ),
+        vh_nodes as (
+            select virus_species_id, node_type_a node_type, node_id_a node_id from vh
+            union
+            select virus_species_id, node_type_b node_type, node_id_b node_id from vh
+        )
+        select * from vh
+
+        union all
+
+        select
+          nodes_a.virus_species_id,
+          es.node_type_a,
+          es.node_type_b,
+          es.node_id_a,
+          es.node_id_b,
+          es.score_type,
+          es.score evidence_score
+        from
+          network.evidence_scores es
+          inner join
+            vh_nodes nodes_a
+          on
+            nodes_a.node_type = es.node_type_a
+            and
+            nodes_a.node_id = es.node_id_a
+          inner join
+            vh_nodes nodes_b
+          on
+            nodes_b.virus_species_id = nodes_a.virus_species_id
+            and
+            nodes_b.node_type = es.node_type_b
+            and
+            nodes_b.node_id = es.node_id_b
+        where
+          es.node_type_a = es.node_type_b{species_filter}
+          and
+          es.score_type in %(score_types)s;
+        """,
+        {'host_species_id': host_species_id,
+         'virus_species_ids': tuple(virus_species_ids or ()),
+         'species_ids': (host_species_id,) + tuple(virus_species_ids or ()),
+         'score_types': tuple(score_types)})
+
+    with instrument.phase('group_virus_host_networks', host_species_id=host_species_id):
+        networks = pd.DataFrame(
+                cursor.fetchall(),
+                columns=['virus_species_id', 'node_type_a', 'node_type_b', 'node_id_a', 'node_id_b', 'score_type', 'evidence_score'])
+
+        return {virus_species_id: network.drop(columns='virus_species_id').reset_index(drop=True)
+                for virus_species_id, network in networks.groupby('virus_species_id', sort=True)}
+
+
+# maps node_id_a and node_id_b through the string_id -> external_id frame,
+# keeping row order and duplicate edges; edges with an unmapped end are dropped
+def map_network_ids(network, external_ids):
+    string_ids = pd.Index(external_ids.string_id.to_numpy())
+    new_ids = external_ids.external_id.to_numpy()
+
+    codes_a = string_ids.get_indexer(network.node_id_a.to_numpy())
+    codes_b = string_ids.get_indexer(network.node_id_b.to_numpy())
+    mapped = (codes_a >= 0) & (codes_b >= 0)
 
-    external_ids = stringdb.get_prots_external_ids(cursor, frozenset(network.node_id_a) | frozenset(network.node_id_b))
-    external_ids = external_ids.set_index('string_id')
+    if not mapped.all():
+        network = network.loc[mapped]
+        codes_a, codes_b = codes_a[mapped], codes_b[mapped]
 
-    network = pd.concat([
-            network.set_index('node_id_a'),
-            external_ids.rename(columns={'external_id': 'node_id_a'})
-        ],
-        axis=1, join='inner')
+    return network.assign(node_id_a=new_ids[codes_a], node_id_b=new_ids[codes_b])
 
-    network = pd.concat([
-            network.set_index('node_id_b'),
-            external_ids.rename(columns={'external_id': 'node_id_b'})
-        ],
-        axis=1, join='inner')
+def get_network_node_ids(network):
+    return pd.unique(np.concatenate([network.node_id_a.to_numpy(), network.node_id_b.to_numpy()])).tolist()
 
-    return network.loc[:, orig_columns]
+
+# maps node_id_a from string id's to string external id's
+#      node_id_b from string id's to string external id's
+def network_with_external_ids(cursor, network):
+    external_ids = stringdb.get_prots_external_ids(cursor, get_network_node_ids(network))
+    return map_network_ids(network, external_ids)
 
 
 def get_species_official_names(cursor, species_ids=None):
@@ -286,3 +385,37 @@ def get_species_official_names(cursor, species_ids=None):
     return pd.DataFrame(
         cursor.fetchall(),
         columns=['species_id', 'official_name'])
+
+
+# cached variants, which only query the database when the extract is not in
+# the local cache (see stringdb_cache.Cache)
+def get_species_interactions_cached(cache, species_ids, score_types):
+    species_ids = tuple(sorted(frozenset(species_ids)))
+    score_types = tuple(sorted(frozenset(score_types)))
+
+    return cache.frame(None, 'species_interactions', (species_ids, score_types), lambda cursor:
+        get_species_interactions(cursor, species_ids, score_types))
+
+def get_all_virus_host_interactions_cached(cache, host_species_id, score_types):
+    score_types = tuple(sorted(frozenset(score_types)))
+
+    return cache.frame(host_species_id, 'all_virus_host_interactions', score_types, lambda cursor:
+        get_all_virus_host_interactions(cursor, host_species_id, score_types))
+
+def get_all_virus_host_networks_cached(cache, host_species_id, score_types):
+    vh = get_all_virus_host_interactions_cached(cache, host_species_id, score_types)
+    virus_species_ids = frozenset(vh.node_type_a) | frozenset(vh.node_type_b)
+    virus_species_ids = tuple(virus_species_ids - {host_species_id})
+    vv = get_species_interactions_cached(cache, virus_species_ids, score_types)
+
+    return pd.concat([vh, vv])
+
+def network_with_external_ids_cached(cache, network):
+    external_ids = cache.get_prots_external_ids(get_network_node_ids(network))
+    return map_network_ids(network, external_ids)
+
+def get_species_official_names_cached(cache, species_ids=None):
+    species_ids = None if species_ids is None else tuple(sorted(frozenset(species_ids)))
+
+    return cache.frame(None, 'species_official_names', species_ids, lambda cursor:
+        get_species_official_names(cursor, species_ids))